@@ -4,9 +4,12 @@ import shutil
 import subprocess
 import pysofaconventions as sofa
 import time
+import tempfile
+import threading
+import asyncio
 from functools import wraps
 
-import requests
+import uvicorn
 import yt_dlp
 
 import numpy as np
@@ -25,9 +28,26 @@ from constants.allowed_users import ALLOWED_USERS
 from constants.admin_users import ADMIN_USERS
 from outh_data import YOUTUBE_API_KEY
 from sp_tools.markup_creation import create_markup
-
-from spotify.spotify_logik import get_tracks_from_playlist, download_and_send_track, bot, split_file, \
-    download_track_for_zip, DownloadProgress, get_track, get_track_single, search_spotify_tracks
+from sp_tools.job_bus import RedisJobBus, EVENT_DEAD
+from sp_tools.session_store import create_session_store
+from sp_tools.job_queue import JobQueue, JobWorkerPool, JOB_TRACK_DOWNLOAD, JOB_PLAYLIST_DOWNLOAD, \
+    JOB_PLAYLIST_ZIP, JOB_EFFECT_RENDER, JOB_VIDEO_DOWNLOAD, PRIORITY_ADMIN, PRIORITY_SINGLE, PRIORITY_PLAYLIST
+from sp_tools.file_id_store import make_track_key, make_effect_key
+from sp_tools.deezer_client import DeezerClient
+from sp_tools.ttl_cache import start_purge_thread
+from sp_tools.zip_volumes import ZipVolumeWriter
+from sp_tools.part_uploader import PartUploader
+from sp_tools.http_sessions import get_session
+from sp_tools.async_runtime import run_async_bot
+from sp_tools.webhook_server import create_webhook_app, WEBHOOK_PATH
+from sp_tools.track_picker import create_track_picker_keyboard, toggle_selection, get_selected_indexes, \
+    get_page_of
+from sp_tools.download_pool import iter_downloads_ordered, get_worker_count, set_worker_count, \
+    get_track_display_name, PlaylistProgress, MAX_DOWNLOAD_WORKERS, download_slots
+
+from spotify.spotify_logik import iter_tracks_from_playlist, download_and_send_track, bot, \
+    download_track_for_zip, DownloadProgress, get_track, get_track_single, search_spotify_tracks, \
+    telegram_file_ids, AUDIO_PROFILE, open_thumbnail, video_matcher, get_runtime_stats, sp, lyrics_store
 from url_checker.url_checker import is_spotify_playlist_url, is_spotify_track_url, is_yt_track_url, is_add_command, \
     is_deezer_playlist_url, is_deezer_track_url, is_video_link, is_inst_link
 import os
@@ -35,9 +55,7 @@ import os
 from datetime import datetime
 import sys
 
-import deezer
-
-from youtube.youtube_logik import download_youtube_track, download_youtube_track_for_zip
+from youtube.youtube_logik import download_youtube_track_for_zip
 
 telebot.apihelper.TIMEOUT = 60
 
@@ -82,15 +100,42 @@ def handle_exception(exc_type, exc_value, exc_traceback):
 
 sys.excepthook = handle_exception
 
-# Словники для зберігання даних користувачів
-search_sessions = {}
-user_track_yt = {}
-user_tracks = {}
-user_v_or_a = {}
-user_delivery_method = {}  # Зберігання вибраного способу надсилання
-user_temp_folders = {}  # Зберігання шляхів до тимчасових папок
-# Додамо словник для зберігання вибраного формату користувача
-user_audio_format = {}
+# Якщо задано REDIS_URL, черга задач і сесії користувачів спільні для всіх процесів бота
+if os.environ.get("REDIS_URL"):
+    import redis
+    redis_client = redis.Redis.from_url(os.environ["REDIS_URL"], decode_responses=True)
+else:
+    redis_client = None
+
+# Скільки треків з усіх збережених плейлистів тримати в пам'яті
+MAX_SESSION_TRACKS = 100000
+# Сесії користувачів: записи живуть SESSION_TTL після останнього звернення, кількість обмежена
+user_track_yt = create_session_store("track_yt", redis_client)
+# Знайдені треки і плейлисти; вага запису — кількість треків. Понад MAX_SESSION_TRACKS
+# витісняються найдавніше використані записи, скільки б треків у них не було
+user_tracks = create_session_store("tracks", redis_client, max_weight=MAX_SESSION_TRACKS)
+user_delivery_method = create_session_store("delivery", redis_client)  # Вибраний спосіб надсилання
+user_track_selection = create_session_store("selection", redis_client)  # Вибрані треки (бітова маска)
+user_audio_format = create_session_store("audio_format", redis_client)  # Вибраний формат
+# Черга важких задач (завантаження, ZIP, ефекти, відео), які виконуються поза потоком polling.
+# З Redis задачі йдуть через Redis Streams і їх можуть виконувати окремі процеси (--worker)
+job_queue = RedisJobBus(redis_client) if redis_client is not None else JobQueue()
+deezer_client = DeezerClient()
+
+
+def enqueue_job(kind, user_id, chat_id, payload, priority=PRIORITY_SINGLE):
+    """Додає задачу в чергу та повідомляє користувача, якщо перед нею є інші задачі"""
+    if user_id in ADMIN_USERS:
+        priority = PRIORITY_ADMIN
+
+    payload = dict(payload, chat_id=chat_id, user_id=user_id)
+    job_id = job_queue.enqueue(kind, user_id, payload, priority)
+
+    position = job_queue.position(job_id)
+    if position:
+        bot.send_message(chat_id, f"⏳ Запит додано в чергу. Задач перед вами: {position}")
+    return job_id
+
 # URL для пошуку відео
 YOUTUBE_SEARCH_URL = "https://www.googleapis.com/youtube/v3/search"
 
@@ -109,7 +154,7 @@ def search_youtube(query, page_token=None):
     url = f"https://www.googleapis.com/youtube/v3/search?part=snippet&type=video&videoCategoryId=10&q={query}&key={YOUTUBE_API_KEY}&maxResults=5"
     if page_token:
         url += f"&pageToken={page_token}"
-    response = requests.get(url)
+    response = get_session("youtube").get(url)
     return response.json()
 
 
@@ -273,6 +318,41 @@ def check_user_admin_access(func):
     return wrapper
 
 
+def get_bot_stats():
+    """Стан черги, сесій і кешів бота"""
+    stats = get_runtime_stats()
+    stats["queued_jobs"] = job_queue.pending_count()
+    stats["deezer_cache"] = deezer_client.cache.stats()
+    stats["sessions"] = {"tracks": user_tracks.stats(), "audio_format": user_audio_format.stats()}
+    return stats
+
+
+def format_bot_stats(stats):
+    """Короткий текстовий звіт для адміністратора"""
+    limiter = stats["telegram_limiter"]
+    lines = [
+        f"Задач у черзі: {stats['queued_jobs']}",
+        f"Telegram: дозволів {limiter['granted']}, з очікуванням {limiter['throttled']}, "
+        f"середнє очікування {limiter['average_delay']:.2f} с, 429: {limiter['flood_errors']}",
+    ]
+    for name in ("audio_cache", "lyrics_store", "spotify_cache", "deezer_cache"):
+        lines.append(f"{name}: влучань {stats[name]['hit_rate']:.0%} ({stats[name]['hits']}/{stats[name]['misses']} промахів)")
+    for name, session in stats["http"]["sessions"].items():
+        lines.append(f"HTTP {name}: запитів {session['requests']}, повторне використання з'єднань {session['reuse_rate']:.0%}")
+    for host, host_stats in stats["http"]["hosts"].items():
+        lines.append(f"{host}: {host_stats['requests']} запитів, помилок {host_stats['errors']}, "
+                     f"середня затримка {host_stats['average_latency']:.2f} с")
+    return "\n".join(lines)
+
+
+@bot.message_handler(func=lambda message: message.text.lower().startswith("!статистика"))
+@check_user_access
+@check_user_admin_access
+def handle_stats(message):
+    # Повідомлення Telegram обмежене 4096 символами
+    bot.reply_to(message, format_bot_stats(get_bot_stats())[:4000])
+
+
 @bot.message_handler(func=lambda message: is_add_command(message.text))
 @check_user_access
 @check_user_admin_access
@@ -302,30 +382,14 @@ def add_allowed_users(message):
 
 def get_deezer_track(track_url):
     """Отримує інформацію про трек з Deezer"""
-    client = deezer.Client()
     track_id = re.search(r'track/(\d+)', track_url).group(1)
-    track = client.get_track(track_id)
-
-    return [{
-        "name": track.title,
-        "artist": track.artist.name
-    }]
+    return [deezer_client.get_track(track_id)]
 
 
 def get_deezer_tracks_from_playlist(playlist_url):
     """Отримує треки з плейлиста Deezer"""
-    client = deezer.Client()
     playlist_id = re.search(r'playlist/(\d+)', playlist_url).group(1)
-    playlist = client.get_playlist(playlist_id)
-
-    tracks = []
-    for track in playlist.tracks:
-        tracks.append({
-            "name": track.title,
-            "artist": track.artist.name
-        })
-
-    return tracks
+    return deezer_client.get_playlist_tracks(playlist_id)
 
 @bot.message_handler(func=lambda message: is_deezer_track_url(message.text))
 @check_user_access
@@ -387,18 +451,12 @@ def download_video(url, chat_id, user_id):
 @bot.message_handler(func=lambda message: is_inst_link(message.text))
 @check_user_access
 def handle_video(message):
-    user = message.from_user.id
-    url = message.text
-    chat_id = message.chat.id
-    download_video(url, chat_id, user)
+    enqueue_job(JOB_VIDEO_DOWNLOAD, message.from_user.id, message.chat.id, {"url": message.text})
 
 @bot.message_handler(func=lambda message: is_video_link(message.text))
 @check_user_access
 def handle_video(message):
-    user = message.from_user.id
-    url = message.text
-    chat_id = message.chat.id
-    download_video(url, chat_id, user)
+    enqueue_job(JOB_VIDEO_DOWNLOAD, message.from_user.id, message.chat.id, {"url": message.text})
 
 @bot.message_handler(func=lambda message: is_deezer_playlist_url(message.text))
 @check_user_access
@@ -406,6 +464,8 @@ def handle_deezer_playlist(message):
     try:
         tracks = get_deezer_tracks_from_playlist(message.text)
         user_tracks[message.from_user.id] = tracks
+        # Як і для Spotify, відео шукаються наперед, поки користувач обирає формат
+        video_matcher.prefetch(tracks)
 
         # Спочатку питаємо про формат
         markup = create_format_selection_keyboard(message)
@@ -475,26 +535,6 @@ def create_delivery_method_keyboard():
     return markup
 
 
-def create_tracks_keyboard(tracks):
-    """Створює клавіатуру з треками"""
-    markup = InlineKeyboardMarkup(row_width=1)
-
-    for i, track in enumerate(tracks):
-        if track.get('is_youtube'):
-            # Використовуємо вже отримані метадані
-            track_name = f"{track['author']} - {track['title']}"
-        else:
-            # Обробка Spotify треків залишається без змін
-            track_name = f"{track['artist']} - {track['name']}"
-
-        markup.add(InlineKeyboardButton(
-            text=track_name,
-            callback_data=f"track_{i}"
-        ))
-
-    markup.add(InlineKeyboardButton("Завантажити все", callback_data="download_all"))
-    return markup
-
 @bot.message_handler(commands=['start'])
 @check_user_access
 def start_message(message):
@@ -520,6 +560,22 @@ def handle_search(message):
 
     bot.send_message(message.chat.id, response_text, parse_mode="Markdown", reply_markup=markup)
 
+@bot.message_handler(func=lambda message: message.text.lower().startswith("!потоки"))
+@check_user_access
+def handle_download_workers(message):
+    """Налаштування кількості треків, що завантажуються одночасно: '!потоки 4'"""
+    parts = message.text.split()
+    if len(parts) < 2 or not parts[1].isdigit():
+        bot.reply_to(
+            message,
+            f"Зараз одночасно завантажується треків: {get_worker_count(message.from_user.id)}\n"
+            f"Щоб змінити, надішліть '!потоки N' (від 1 до {MAX_DOWNLOAD_WORKERS})"
+        )
+        return
+
+    workers = set_worker_count(message.from_user.id, int(parts[1]))
+    bot.reply_to(message, f"✅ Тепер одночасно завантажується треків: {workers}")
+
 @bot.message_handler(func=lambda message: is_spotify_track_url(message.text))
 @check_user_access
 def handle_spotify_track(message):
@@ -591,8 +647,12 @@ def handle_yt_track(message):
 def handle_playlist_url(message):
     """Оновлений обробник URL плейлиста"""
     try:
-        # Отримуємо треки
-        tracks = get_tracks_from_playlist(message.text)
+        # Треки надходять посторінково: пошук відео для першої сторінки починається,
+        # поки наступна ще завантажується зі Spotify
+        tracks = []
+        for track in iter_tracks_from_playlist(message.text):
+            tracks.append(track)
+            video_matcher.prefetch([track])
         user_tracks[message.from_user.id] = tracks
 
         # Спочатку питаємо про формат
@@ -608,11 +668,12 @@ def handle_playlist_url(message):
         bot.reply_to(message, f"Виникла помилка при обробці плейлиста: {str(e)}")
 
 def create_temp_folder(user_id):
-    """Створює тимчасову папку для користувача"""
-    folder_name = f"temp_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-    path = f"temp/{folder_name}"
-    os.makedirs(path, exist_ok=True)
-    return path
+    """
+    Створює тимчасову папку для задачі користувача. Ім'я унікальне, бо задачі одного
+    користувача можуть виконуватися одночасно в різних виконавцях
+    """
+    os.makedirs("temp", exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"temp_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_", dir="temp")
 
 
 def cleanup_temp_folder(folder_path):
@@ -632,7 +693,8 @@ def handle_audio(message):
     markup = telebot.types.ReplyKeyboardMarkup(one_time_keyboard=True)
     markup.add('BassBoost', 'SpeedUp', 'Reverb', '8d')
     msg = bot.reply_to(message, 'Виберіть опцію:', reply_markup=markup)
-    bot.register_next_step_handler(msg, process_option_step, message.audio.file_id)
+    # file_id потрібен для завантаження, а file_unique_id однаковий для того самого файлу в усіх користувачів
+    bot.register_next_step_handler(msg, process_option_step, message.audio.file_id, message.audio.file_unique_id)
 
 def convert_to_wav(input_path, output_path):
     audio = AudioSegment.from_file(input_path)
@@ -641,37 +703,42 @@ def convert_to_m4a(input_path, output_path):
     audio = AudioSegment.from_file(input_path)
     audio.export(output_path, format="m4a")
 
-def process_option_step(message, file_id):
+def process_option_step(message, file_id, file_unique_id):
     if message.text == 'BassBoost':
         bot.reply_to(message, 'Зачекайте! Обробка триває...')
-        process_dance_eq_step(message, file_id)
+        enqueue_effect_job(message, file_id, file_unique_id, "bassboost")
     elif message.text == 'Reverb':
         bot.reply_to(message, 'Зачекайте! Обробка триває...')
-        process_reverb_step(message, file_id)
+        enqueue_effect_job(message, file_id, file_unique_id, "reverb")
     elif message.text == '8d':
         markup = telebot.types.ReplyKeyboardMarkup(one_time_keyboard=True)
         markup.add('Kemar', 'SAMREC-2500R', 'D1')
         msg = bot.reply_to(message, 'Оберіть за яким сетом створювати ефект. \n<i>(Експерементуйте, оберіть один, а потім спробуйте інший)</i> \n<b>Поділіться враженням написавши відгук сюди <a href="https://t.me/spdownloader">Channel</a></b>', parse_mode="HTML", reply_markup=markup)
-        bot.register_next_step_handler(msg, process_8d_step_1, file_id)
+        bot.register_next_step_handler(msg, process_8d_step_1, file_id, file_unique_id)
     elif message.text == 'SpeedUp':
         msg = bot.reply_to(message, 'Введіть число від 1 до 2:')
-        bot.register_next_step_handler(msg, process_speed_up_step, file_id)
+        bot.register_next_step_handler(msg, process_speed_up_step, file_id, file_unique_id)
     else:
         bot.reply_to(message, 'Неправильний вибір. Спробуйте знову.')
 
-def process_8d_step_1(message, file_id):
+def enqueue_effect_job(message, file_id, file_unique_id, effect, **params):
+    """Ставить обробку аудіо ефектом у чергу задач"""
+    payload = {"file_id": file_id, "file_unique_id": file_unique_id, "effect": effect, "message_id": message.message_id}
+    payload.update(params)
+    enqueue_job(JOB_EFFECT_RENDER, message.from_user.id, message.chat.id, payload)
+
+def process_8d_step_1(message, file_id, file_unique_id):
     if message.text == "Kemar":
         bot.reply_to(message, 'Зачекайте! Обробка триває... Це може зайняти деякий час.')
-        process_8d_step_kemar(message, file_id)
+        enqueue_effect_job(message, file_id, file_unique_id, "8d_kemar")
     elif message.text == "D1":
         bot.reply_to(message, 'Зачекайте! Обробка триває... Це може зайняти деякий час.')
-        process_8d_step_D1(message, file_id)
+        enqueue_effect_job(message, file_id, file_unique_id, "8d_d1")
     elif message.text == "SAMREC-2500R":
         bot.reply_to(message, 'Зачекайте! Обробка триває... Це може зайняти деякий час.')
-        process_8d_step_SAMREC(message, file_id)
+        enqueue_effect_job(message, file_id, file_unique_id, "8d_samrec")
 
 def process_8d_step_SAMREC(message, file_id):
-    global input_file, output_file2, output_file
     try:
         file_info = bot.get_file(file_id)
         file_path = file_info.file_path
@@ -700,11 +767,12 @@ def process_8d_step_SAMREC(message, file_id):
 
         # Відправляємо оброблений файл
         with open(output_file2, "rb") as f:
-            bot.send_audio(message.chat.id, f, reply_to_message_id=message.message_id)
+            sent_message = bot.send_audio(message.chat.id, f, reply_to_message_id=message.message_id)
 
         os.remove(input_file)
         os.remove(output_file)
         os.remove(output_file2)
+        return sent_message
     except Exception as e:
         bot.reply_to(message, f"❌ Помилка: {str(e)}")
 
@@ -748,12 +816,13 @@ def process_8d_step_D1(message, file_id):
 
         # Відправляємо оброблений файл
         with open(output_file3, "rb") as f:
-            bot.send_audio(message.chat.id, f, reply_to_message_id=message.message_id)
+            sent_message = bot.send_audio(message.chat.id, f, reply_to_message_id=message.message_id)
 
         os.remove(input_file)
         os.remove(output_file)
         os.remove(output_file2)
         os.remove(output_file3)
+        return sent_message
     except Exception as e:
         bot.reply_to(message, f"❌ Помилка: {str(e)}")
 
@@ -794,11 +863,12 @@ def process_8d_step_kemar(message, file_id):
 
         # Відправляємо оброблений файл
         with open(output_file2, "rb") as f:
-            bot.send_audio(message.chat.id, f, reply_to_message_id=message.message_id)
+            sent_message = bot.send_audio(message.chat.id, f, reply_to_message_id=message.message_id)
 
         os.remove(input_file)
         os.remove(output_file)
         os.remove(output_file2)
+        return sent_message
     except Exception as e:
         bot.reply_to(message, f"❌ Помилка: {str(e)}")
 
@@ -812,7 +882,6 @@ def process_8d_step_kemar(message, file_id):
 
 
 def process_reverb_step(message, file_id):
-    global input_file, output_file2, output_file
     try:
         file_info = bot.get_file(file_id)
         file_path = file_info.file_path
@@ -836,11 +905,12 @@ def process_reverb_step(message, file_id):
 
         # Відправляємо оброблений файл
         with open(output_file2, "rb") as f:
-            bot.send_audio(message.chat.id, f, reply_to_message_id=message.message_id)
+            sent_message = bot.send_audio(message.chat.id, f, reply_to_message_id=message.message_id)
 
         os.remove(input_file)
         os.remove(output_file)
         os.remove(output_file2)
+        return sent_message
     except Exception as e:
         bot.reply_to(message, f"❌ Помилка: {str(e)}")
 
@@ -853,7 +923,6 @@ def process_reverb_step(message, file_id):
             os.remove(input_file)
 
 def process_dance_eq_step(message, file_id):
-    global input_file, output_file, output_file2
     try:
         file_info = bot.get_file(file_id)
         file_path = file_info.file_path
@@ -864,7 +933,7 @@ def process_dance_eq_step(message, file_id):
 
         input_file = f"downloads/{file_id}.{extension}"
         output_file = f"downloads/{file_id}_processed.wav"
-        output_file2 = f"downloads/track.wav"
+        output_file2 = f"downloads/{file_id}-bassboost.wav"
 
         # Завантажуємо файл
         downloaded_file = bot.download_file(file_path)
@@ -877,11 +946,12 @@ def process_dance_eq_step(message, file_id):
 
         # Відправляємо оброблений файл
         with open(output_file2, "rb") as f:
-            bot.send_audio(message.chat.id, f, reply_to_message_id=message.message_id)
+            sent_message = bot.send_audio(message.chat.id, f, reply_to_message_id=message.message_id)
 
         os.remove(input_file)
         os.remove(output_file)
         os.remove(output_file2)
+        return sent_message
     except Exception as e:
         bot.reply_to(message, f"❌ Помилка: {str(e)}")
 
@@ -893,40 +963,47 @@ def process_dance_eq_step(message, file_id):
         if os.path.exists('downloads/temp.wav'):
             os.remove(input_file)
 
-def process_speed_up_step(message, file_id):
-    bot.reply_to(message, 'Зачекайте! Обробка триває...')
+def process_speed_up_step(message, file_id, file_unique_id):
     try:
         speed = float(message.text)
-        if 1 <= speed <= 2:
-            file_info = bot.get_file(file_id)
-            file_path = file_info.file_path
+    except ValueError:
+        bot.reply_to(message, 'Неправильне число. Спробуйте знову.')
+        return
 
-            # Отримуємо оригінальне ім'я файлу та розширення
-            original_filename = file_path.split("/")[-1]
-            extension = original_filename.split(".")[-1]
+    if 1 <= speed <= 2:
+        bot.reply_to(message, 'Зачекайте! Обробка триває...')
+        enqueue_effect_job(message, file_id, file_unique_id, "speedup", speed=speed)
+    else:
+        bot.reply_to(message, 'Число повинно бути між 1 і 2. Спробуйте знову.')
 
-            input_file = f"downloads/{file_id}.{extension}"
-            output_file = f"downloads/{file_id}_processed.{extension}"
 
-            # Завантажуємо файл
-            downloaded_file = bot.download_file(file_path)
-            with open(input_file, "wb") as f:
-                f.write(downloaded_file)
+def render_speed_up(message, file_id, speed):
+    file_info = bot.get_file(file_id)
+    file_path = file_info.file_path
 
-            speed_up_audio(input_file, output_file, speed)
+    # Отримуємо оригінальне ім'я файлу та розширення
+    original_filename = file_path.split("/")[-1]
+    extension = original_filename.split(".")[-1]
 
-            bot.reply_to(message, f'Швидкість збільшено на {speed} рази.')
+    input_file = f"downloads/{file_id}.{extension}"
+    output_file = f"downloads/{file_id}_processed.{extension}"
 
-            # Відправляємо оброблений файл
-            with open(output_file, "rb") as f:
-                bot.send_audio(message.chat.id, f, reply_to_message_id=message.message_id)
+    # Завантажуємо файл
+    downloaded_file = bot.download_file(file_path)
+    with open(input_file, "wb") as f:
+        f.write(downloaded_file)
 
-            os.remove(input_file)
-            os.remove(output_file)
-        else:
-            bot.reply_to(message, 'Число повинно бути між 1 і 2. Спробуйте знову.')
-    except ValueError:
-        bot.reply_to(message, 'Неправильне число. Спробуйте знову.')
+    speed_up_audio(input_file, output_file, speed)
+
+    bot.reply_to(message, f'Швидкість збільшено на {speed} рази.')
+
+    # Відправляємо оброблений файл
+    with open(output_file, "rb") as f:
+        sent_message = bot.send_audio(message.chat.id, f, reply_to_message_id=message.message_id)
+
+    os.remove(input_file)
+    os.remove(output_file)
+    return sent_message
 
 
 # --- ФУНКЦІЯ ДЛЯ ОБРОБКИ ---
@@ -1187,38 +1264,83 @@ def handle_callback(call):
             bot.answer_callback_query(call.id, "Помилка: треки не знайдено")
             return
 
+        # Важка робота виконується в черзі задач, щоб не блокувати інших користувачів
+        payload = {
+            "message_id": call.message.message_id,
+            "audio_format": user_audio_format.get(user_id, "mp3"),
+            "delivery": user_delivery_method.get(user_id, "single"),
+            # Налаштування !потоки передається в задачі: виконавці можуть працювати в інших процесах
+            "workers": get_worker_count(user_id),
+        }
+
+        # Перегляд плейлиста: вибір треків і гортання сторінок оновлюють лише клавіатуру
+        if call.data.startswith("pick_") or call.data.startswith("page_"):
+            handle_track_picker(call, tracks)
+            return
+
         if call.data.startswith("track_"):
             track_index = int(call.data.split('_')[1])
-            track = tracks[track_index]
-
-            # Завантажуємо трек в залежності від джерела (YouTube чи Spotify)
-            if user_delivery_method.get(user_id) == "zip":
-                handle_zip_download(call, [track])
-            else:
-                if track.get('is_youtube'):
-                    download_youtube_track(track, call.message.chat.id, user_audio_format)
-                else:
-                    download_and_send_track(track, call.message.chat.id, user_audio_format)
-
-        elif call.data == "download_all":
-            if user_delivery_method.get(user_id) == "zip":
-                handle_zip_download(call, tracks)
-            else:
-                handle_single_download(call, tracks)
+            payload["track"] = tracks[track_index]
+            enqueue_job(JOB_TRACK_DOWNLOAD, user_id, call.message.chat.id, payload)
+            bot.answer_callback_query(call.id, "Трек додано в чергу")
+
+        elif call.data in ("download_all", "download_selected"):
+            if call.data == "download_selected":
+                selection = user_track_selection.get(user_id, 0)
+                tracks = [tracks[i] for i in get_selected_indexes(selection, len(tracks))]
+                if not tracks:
+                    bot.answer_callback_query(call.id, "Спочатку виберіть треки")
+                    return
+
+            payload["tracks"] = tracks
+            priority = PRIORITY_PLAYLIST if len(tracks) > 1 else PRIORITY_SINGLE
+            kind = JOB_PLAYLIST_ZIP if payload["delivery"] == "zip" else JOB_PLAYLIST_DOWNLOAD
+            enqueue_job(kind, user_id, call.message.chat.id, payload, priority)
+            bot.answer_callback_query(call.id, "Плейлист додано в чергу")
 
     except Exception as e:
         logger.exception(f"Error in callback handler: {str(e)}")
         bot.send_message(call.message.chat.id, f"Виникла помилка: {str(e)}")
 
 
+def handle_track_picker(call, tracks):
+    """Вибір треку або перехід на іншу сторінку: перемальовується лише видима сторінка"""
+    user_id = call.from_user.id
+    selection = user_track_selection.get(user_id, 0)
+    action, value = call.data.split("_", 1)
+
+    if value == "noop":
+        bot.answer_callback_query(call.id)
+        return
+
+    index = int(value)
+    if action == "pick":
+        if index >= len(tracks):
+            bot.answer_callback_query(call.id, "Список треків застарів, надішліть посилання ще раз")
+            return
+        selection = toggle_selection(selection, index)
+        user_track_selection[user_id] = selection
+        page = get_page_of(index)
+    else:
+        page = index
+
+    bot.edit_message_reply_markup(
+        call.message.chat.id,
+        call.message.message_id,
+        reply_markup=create_track_picker_keyboard(tracks, page, selection)
+    )
+    bot.answer_callback_query(call.id)
+
+
 def handle_delivery_method(call):
     """Обробка вибору способу надсилання"""
     user_id = call.from_user.id
     tracks = user_tracks.get(user_id)
+    user_track_selection[user_id] = 0
 
     if call.data == "delivery_single":
         user_delivery_method[user_id] = "single"
-        markup = create_tracks_keyboard(tracks)
+        markup = create_track_picker_keyboard(tracks)
         bot.edit_message_text(
             "Обери треки для завантаження:",
             call.message.chat.id,
@@ -1228,7 +1350,7 @@ def handle_delivery_method(call):
 
     elif call.data == "delivery_zip":
         user_delivery_method[user_id] = "zip"
-        markup = create_tracks_keyboard(tracks)
+        markup = create_track_picker_keyboard(tracks)
         bot.edit_message_text(
             "Обери треки для завантаження в ZIP архів:",
             call.message.chat.id,
@@ -1237,38 +1359,140 @@ def handle_delivery_method(call):
         )
 
 
-def handle_single_download(call, tracks):
-    """Обробка завантаження по одному файлу"""
-    if call.data == "download_all":
-        bot.edit_message_text(
-            "Починаю завантаження всіх треків...",
-            call.message.chat.id,
-            call.message.message_id
-        )
+def download_track_to_folder(temp_folder, track, progress, audio_format):
+    """
+    Завантажує трек (Spotify/Deezer або YouTube) у тимчасову папку і повертає шлях до файлу.
+    progress — TrackProgress із пулу завантажень, його index робить ім'я файлу унікальним
+    """
+    if track.get('is_youtube'):
+        return download_youtube_track_for_zip(temp_folder, track, progress, audio_format)
+    return download_track_for_zip(temp_folder, track, progress, audio_format, progress.index)
 
-        total_tracks = len(tracks)
-        for i, track in enumerate(tracks, 1):
-            try:
-                bot.send_message(
-                    call.message.chat.id,
-                    f"Завантаження треку {i}/{total_tracks}: {track['artist']} - {track['name']}"
-                )
-                download_and_send_track(track, call.message.chat.id, user_audio_format)
-            except Exception as e:
+
+def get_track_title_performer(track):
+    if track.get('is_youtube'):
+        return track['title'], track['author']
+    return track['name'], track['artist']
+
+
+def send_cached_track(chat_id, track, audio_format):
+    """Надсилає трек за збереженим file_id. Повертає False, якщо трек ще не надсилали"""
+    title, performer = get_track_title_performer(track)
+    file_key = make_track_key(track, audio_format, AUDIO_PROFILE)
+    return bool(telegram_file_ids.send_cached_audio(bot, chat_id, file_key, title=title, performer=performer))
+
+
+def download_and_send_youtube_track(track, chat_id, audio_format):
+    """Завантажує трек з YouTube, надсилає його і запам'ятовує file_id, як і для треків Spotify"""
+    if send_cached_track(chat_id, track, audio_format):
+        return
+
+    track_name = get_track_display_name(track)
+    progress = DownloadProgress(bot, chat_id, track_name)
+    temp_folder = create_temp_folder(chat_id)
+    try:
+        progress.send_initial_message()
+        file_path = download_youtube_track_for_zip(temp_folder, track, progress, audio_format)
+        send_track_file(chat_id, track, file_path, audio_format)
+        progress.update_progress(100)
+        progress.complete()
+    except Exception as e:
+        logger.exception(f"Error downloading track {track_name}: {str(e)}")
+        progress.fail(e)
+        raise
+    finally:
+        cleanup_temp_folder(temp_folder)
+
+
+def download_and_send_single_track(track, chat_id, audio_format):
+    """Завантажує і надсилає один трек з окремим індикатором прогресу"""
+    with download_slots:
+        if track.get('is_youtube'):
+            download_and_send_youtube_track(track, chat_id, audio_format)
+        else:
+            download_and_send_track(track, chat_id, audio_format)
+
+
+def send_track_file(chat_id, track, file_path, audio_format):
+    """Надсилає готовий аудіофайл користувачу і запам'ятовує його file_id"""
+    title, performer = get_track_title_performer(track)
+
+    # Мініатюра обкладинки є лише для треків Spotify
+    thumbnail = None if track.get('is_youtube') else open_thumbnail(track)
+    try:
+        with open(file_path, 'rb') as audio:
+            sent_message = bot.send_audio(
+                chat_id=chat_id,
+                audio=audio,
+                title=title,
+                performer=performer,
+                thumbnail=thumbnail
+            )
+    finally:
+        if thumbnail:
+            thumbnail.close()
+    telegram_file_ids.remember(make_track_key(track, audio_format, AUDIO_PROFILE), sent_message)
+
+
+def handle_single_download(chat_id, message_id, user_id, tracks, audio_format, workers):
+    """Обробка завантаження всіх треків по одному файлу"""
+    total_tracks = len(tracks)
+
+    status_message = bot.edit_message_text(
+        "Починаю завантаження всіх треків...",
+        chat_id,
+        message_id
+    )
+
+    temp_folder = create_temp_folder(user_id)
+    playlist_progress = PlaylistProgress(bot, chat_id, status_message.message_id, total_tracks)
+
+    def download_or_reuse(track, progress):
+        # Трек, який уже є в Telegram, не завантажуємо — його надішлемо за file_id
+        if telegram_file_ids.get(make_track_key(track, audio_format, AUDIO_PROFILE)):
+            return None
+        return download_track_to_folder(temp_folder, track, progress, audio_format)
+
+    # Відео для всіх треків шукаються наперед, поки завантажуються перші
+    video_matcher.prefetch(
+        [track for track in tracks if not telegram_file_ids.get(make_track_key(track, audio_format, AUDIO_PROFILE))]
+    )
+
+    # Треки завантажуються паралельно, але надсилаються в порядку плейлиста
+    downloads = iter_downloads_ordered(tracks, download_or_reuse, workers, playlist_progress)
+    try:
+        for i, track, output_path, error in downloads:
+            track_name = get_track_display_name(track)
+            if not error and output_path is None:
+                try:
+                    if not send_cached_track(chat_id, track, audio_format):
+                        # file_id більше не дійсний — завантажуємо звичайним способом
+                        download_and_send_single_track(track, chat_id, audio_format)
+                except Exception as e:
+                    bot.send_message(chat_id, f"❌ Помилка при завантаженні {track_name}: {str(e)}")
+                continue
+
+            if error or not os.path.exists(output_path):
                 bot.send_message(
-                    call.message.chat.id,
-                    f"❌ Помилка при завантаженні {track['artist']} - {track['name']}: {str(e)}"
+                    chat_id,
+                    f"❌ Помилка при завантаженні {track_name}: {str(error or 'файл не створено')}"
                 )
+                continue
 
-        bot.send_message(
-            call.message.chat.id,
-            f"✅ Завантаження всіх треків завершено!"
-        )
+            try:
+                send_track_file(chat_id, track, output_path, audio_format)
+            except Exception as e:
+                logger.exception(f"Error sending track {track_name}: {str(e)}")
+                bot.send_message(chat_id, f"❌ Помилка при надсиланні {track_name}: {str(e)}")
+            finally:
+                os.remove(output_path)
+    finally:
+        cleanup_temp_folder(temp_folder)
 
-    else:
-        track_index = int(call.data.split('_')[1])
-        track = tracks[track_index]
-        download_and_send_track(track, call.message.chat.id, user_audio_format)
+    bot.send_message(
+        chat_id,
+        f"✅ Завантаження всіх треків завершено!"
+    )
 
 
 def send_large_file(bot, chat_id, file_path, caption=None, max_retries=3):
@@ -1293,122 +1517,267 @@ def send_large_file(bot, chat_id, file_path, caption=None, max_retries=3):
             time.sleep(5)  # Чекаємо перед повторною спробою
 
 
-def handle_zip_download(call, tracks):
+def handle_zip_download(chat_id, message_id, user_id, tracks, audio_format, workers):
     """Оновлена функція для створення ZIP архіву з підтримкою YouTube"""
-    global user_id, track_name
+    uploader = None
+    zip_writer = None
+    temp_folder = None
     try:
-        user_id = call.from_user.id
         temp_folder = create_temp_folder(user_id)
-        user_temp_folders[user_id] = temp_folder
 
         status_message = bot.edit_message_text(
             "Підготовка до створення ZIP архіву...",
-            call.message.chat.id,
-            call.message.message_id
+            chat_id,
+            message_id
         )
 
         total_tracks = len(tracks)
-        downloaded_files = []
-
-        for i, track in enumerate(tracks, 1):
-            try:
-                if track.get('is_youtube'):
-                    # Для YouTube треківє
 
+        def upload_part(number, path):
+            # Загальна кількість частин ще невідома — її буде додано в підпис наприкінці
+            sent_message = send_large_file(bot, chat_id, path, caption=f"Частина {number}")
+            os.remove(path)
+            return sent_message
+
+        # Закриті томи надсилаються у фоні, поки наступні треки ще завантажуються
+        uploader = PartUploader(upload_part)
+        zip_writer = ZipVolumeWriter(temp_folder, on_volume_closed=lambda path, number: uploader.submit(number, path))
+        playlist_progress = PlaylistProgress(
+            bot,
+            chat_id,
+            status_message.message_id,
+            total_tracks,
+            title="Завантаження треків для ZIP архіву"
+        )
 
-                    track_name = f"{track['author']} - {track['title']}"
-                else:
-                    # Для Spotify треків
-                    track_name = f"{track['artist']} - {track['name']}"
+        video_matcher.prefetch(tracks)
 
-                bot.edit_message_text(
-                    f"⏳ Завантаження треку {i}/{total_tracks}:\n"
-                    f"{track_name}\n"
-                    f"Загальний прогрес: [{i}/{total_tracks}]",
-                    call.message.chat.id,
-                    status_message.message_id
+        # Кілька треків завантажуються одночасно, порядок у архіві зберігається
+        downloads = iter_downloads_ordered(
+            tracks,
+            lambda track, progress: download_track_to_folder(temp_folder, track, progress, audio_format),
+            workers,
+            playlist_progress
+        )
+        for i, track, output_path, error in downloads:
+            if error:
+                bot.send_message(
+                    chat_id,
+                    f"❌ Помилка при завантаженні {get_track_display_name(track)}: {str(error)}"
                 )
+            elif output_path and os.path.exists(output_path):
+                # Трек одразу дописується в поточний том архіву, тож на диску не накопичуються файли
+                zip_writer.add(output_path)
+                os.remove(output_path)
+
+        chunks = zip_writer.close()
+        sent_parts, failed_parts = uploader.finish()
 
-                progress = DownloadProgress(bot, call.message.chat.id, track_name)
-                progress.send_initial_message()
-
-                if track.get('is_youtube'):
-                    output_path = download_youtube_track_for_zip(
-                        temp_folder,
-                        track,
-                        progress,
-                        user_audio_format
-                    )
-                else:
-                    output_path = download_track_for_zip(
-                        temp_folder,
-                        track,
-                        progress,
-                        user_audio_format
-                    )
-
-                if output_path and os.path.exists(output_path):
-                    downloaded_files.append(output_path)
+        for number, error in sorted(failed_parts.items()):
+            bot.send_message(
+                chat_id,
+                f"❌ Помилка при надсиланні частини {number}: {str(error)}"
+            )
 
+        # Тепер кількість частин відома — доповнюємо підписи до "Частина i з n"
+        for number, sent_message in sorted(sent_parts.items()):
+            try:
+                bot.edit_message_caption(f"Частина {number} з {len(chunks)}", chat_id, sent_message.message_id)
             except Exception as e:
-                bot.send_message(
-                    call.message.chat.id,
-                    f"❌ Помилка при завантаженні {track_name}: {str(e)}"
-                )
+                logger.warning(f"Failed to update caption of part {number}: {str(e)}")
 
-        # Решта коду для створення та надсилання ZIP архіву залишається без змін
-        if downloaded_files:
-            bot.edit_message_text(
-                "📦 Створення ZIP архіву...",
-                call.message.chat.id,
-                status_message.message_id
-            )
+    except Exception as e:
+        logger.exception(f"Error in ZIP download: {str(e)}")
+        bot.send_message(
+            chat_id,
+            f"Виникла помилка при створенні ZIP архіву: {str(e)}"
+        )
+        # Перед очищенням дочекаємось частин, які вже надсилаються
+        if uploader:
+            uploader.finish()
+    finally:
+        # Недописаний після помилки том закривається, щоб не лишати відкритий файл у папці
+        if zip_writer:
+            zip_writer.discard()
+        if temp_folder:
+            cleanup_temp_folder(temp_folder)
 
-            chunks = split_file(downloaded_files, temp_folder, 49 * 1024 * 1024)
+class JobMessage:
+    """Мінімальна заміна повідомлення telebot для обробників, що виконуються з черги задач"""
 
-            for i, chunk_path in enumerate(chunks, 1):
-                try:
-                    bot.edit_message_text(
-                        f"📤 Надсилання частини {i}/{len(chunks)}...",
-                        call.message.chat.id,
-                        status_message.message_id
-                    )
+    def __init__(self, chat_id, message_id, user_id):
+        self.chat = type('obj', (object,), {'id': chat_id})
+        self.from_user = type('obj', (object,), {'id': user_id})
+        self.message_id = message_id
 
-                    with open(chunk_path, 'rb') as file:
-                        bot.send_document(
-                            chat_id=call.message.chat.id,
-                            document=file,
-                            caption=f"Частина {i} з {len(chunks)}"
-                        )
 
-                    os.remove(chunk_path)
+EFFECT_RENDERERS = {
+    "bassboost": process_dance_eq_step,
+    "reverb": process_reverb_step,
+    "8d_kemar": process_8d_step_kemar,
+    "8d_d1": process_8d_step_D1,
+    "8d_samrec": process_8d_step_SAMREC,
+}
 
-                except Exception as e:
-                    bot.send_message(
-                        call.message.chat.id,
-                        f"❌ Помилка при надсиланні частини {i}: {str(e)}"
-                    )
 
-        # Очищення
-        cleanup_temp_folder(temp_folder)
-        del user_temp_folders[user_id]
+def get_job_workers(payload):
+    """Кількість потоків завантаження, збережена в задачі (для старих задач — поточне налаштування)"""
+    return payload.get("workers") or get_worker_count(payload["user_id"])
+
+
+def run_track_download_job(job):
+    payload = job.payload
+    track = payload["track"]
+    audio_format = payload.get("audio_format") or "mp3"
+
+    # Завантажуємо трек в залежності від джерела (YouTube чи Spotify)
+    if payload["delivery"] == "zip":
+        handle_zip_download(payload["chat_id"], payload["message_id"], payload["user_id"], [track], audio_format,
+                            get_job_workers(payload))
+    elif not send_cached_track(payload["chat_id"], track, audio_format):
+        download_and_send_single_track(track, payload["chat_id"], audio_format)
+
+
+def run_playlist_download_job(job):
+    payload = job.payload
+    handle_single_download(payload["chat_id"], payload["message_id"], payload["user_id"], payload["tracks"],
+                           payload.get("audio_format") or "mp3", get_job_workers(payload))
+
+
+def run_playlist_zip_job(job):
+    payload = job.payload
+    handle_zip_download(payload["chat_id"], payload["message_id"], payload["user_id"], payload["tracks"],
+                        payload.get("audio_format") or "mp3", get_job_workers(payload))
+
+
+def run_effect_render_job(job):
+    payload = job.payload
+    message = JobMessage(payload["chat_id"], payload["message_id"], payload["user_id"])
+
+    # Такий самий файл з таким самим ефектом уже обробляли — надсилаємо результат за file_id
+    params = [payload["speed"]] if payload["effect"] == "speedup" else []
+    effect_key = make_effect_key(payload.get("file_unique_id") or payload["file_id"], payload["effect"], *params)
+    if telegram_file_ids.send_cached_audio(bot, payload["chat_id"], effect_key,
+                                           reply_to_message_id=payload["message_id"]):
+        return
+
+    if payload["effect"] == "speedup":
+        sent_message = render_speed_up(message, payload["file_id"], payload["speed"])
+    else:
+        sent_message = EFFECT_RENDERERS[payload["effect"]](message, payload["file_id"])
+    if sent_message:
+        telegram_file_ids.remember(effect_key, sent_message)
+
+
+def run_video_download_job(job):
+    payload = job.payload
+    download_video(payload["url"], payload["chat_id"], payload["user_id"])
+
+
+JOB_HANDLERS = {
+    JOB_TRACK_DOWNLOAD: run_track_download_job,
+    JOB_PLAYLIST_DOWNLOAD: run_playlist_download_job,
+    JOB_PLAYLIST_ZIP: run_playlist_zip_job,
+    JOB_EFFECT_RENDER: run_effect_render_job,
+    JOB_VIDEO_DOWNLOAD: run_video_download_job,
+}
+
+
+def watch_job_events():
+    """
+    Читає події задач із шини. Задачу, яку кілька разів забрали виконавці, що впали,
+    переносять у dead-letter без виклику обробника, тож користувача повідомляємо тут
+    """
+    while True:
+        try:
+            for event in job_queue.iter_events():
+                if event["status"] == EVENT_DEAD and event["chat_id"]:
+                    bot.send_message(int(event["chat_id"]), "❌ Не вдалося виконати запит. Спробуйте ще раз пізніше.")
+        except Exception as e:
+            logging.error(f"Job event listener error: {str(e)}")
+            time.sleep(5)
+
+
+def start_job_event_listener():
+    if hasattr(job_queue, "iter_events"):
+        threading.Thread(target=watch_job_events, name="job-events", daemon=True).start()
+
+
+def start_cache_purge():
+    """Періодично чистить прострочені записи кешів Spotify і Deezer та сховища текстів пісень"""
+    start_purge_thread([sp.cache, deezer_client.cache, lyrics_store])
 
-    except Exception as e:
-        logger.exception(f"Error in ZIP download: {str(e)}")
-        bot.send_message(
-            call.message.chat.id,
-            f"Виникла помилка при створенні ZIP архіву: {str(e)}"
-        )
-        if user_id in user_temp_folders:
-            cleanup_temp_folder(user_temp_folders[user_id])
-            del user_temp_folders[user_id]
 
 # Запуск бота
 def main():
     # Створюємо папку для тимчасових файлів
     os.makedirs("temp", exist_ok=True)
+    # Виконавці задач працюють у власних потоках, polling лише приймає запити
+    JobWorkerPool(job_queue, JOB_HANDLERS).start()
+    start_job_event_listener()
+    start_cache_purge()
     logging.info("Bot started")
+    # Після запуску в режимі webhook getUpdates не працює, доки webhook не видалено
+    bot.remove_webhook()
     bot.infinity_polling()
 
+
+async def main_async():
+    """
+    Альтернативний запуск на asyncio: оновлення отримує AsyncTeleBot, обробники ті самі,
+    а задачі виконуються в обмежених пулах (окремо мережеві та CPU-задачі)
+    """
+    os.makedirs("temp", exist_ok=True)
+    logging.info("Bot started (asyncio)")
+    bot.remove_webhook()
+    start_job_event_listener()
+    start_cache_purge()
+    await run_async_bot(bot, job_queue, JOB_HANDLERS)
+
+
+def main_webhook():
+    """
+    Запуск у режимі webhook: оновлення приходять на FastAPI-сервер.
+    Налаштування беруться зі змінних середовища WEBHOOK_SECRET (обов'язково),
+    WEBHOOK_URL (публічна адреса; без неї webhook не реєструється — для локальної перевірки)
+    та WEBHOOK_HOST/WEBHOOK_PORT
+    """
+    secret_token = os.environ.get("WEBHOOK_SECRET")
+    if not secret_token:
+        raise RuntimeError("WEBHOOK_SECRET is not set")
+
+    os.makedirs("temp", exist_ok=True)
+    JobWorkerPool(job_queue, JOB_HANDLERS).start()
+    start_job_event_listener()
+    start_cache_purge()
+
+    public_url = os.environ.get("WEBHOOK_URL")
+    if public_url:
+        bot.set_webhook(url=public_url.rstrip("/") + WEBHOOK_PATH, secret_token=secret_token)
+
+    app = create_webhook_app(bot, secret_token, get_bot_stats)
+    logging.info("Bot started (webhook)")
+    uvicorn.run(app, host=os.environ.get("WEBHOOK_HOST", "0.0.0.0"), port=int(os.environ.get("WEBHOOK_PORT", 8080)))
+
+
+def main_worker():
+    """Лише виконавці задач без прийому оновлень (потрібен REDIS_URL, щоб задачі надходили з шини)"""
+    if not isinstance(job_queue, RedisJobBus):
+        raise RuntimeError("REDIS_URL is not set")
+    os.makedirs("temp", exist_ok=True)
+    JobWorkerPool(job_queue, JOB_HANDLERS).start()
+    start_cache_purge()
+    logging.info("Job worker started")
+    while True:
+        time.sleep(3600)
+
+
 if __name__ == "__main__":
-    main()
+    if "--worker" in sys.argv:
+        main_worker()
+    elif "--async" in sys.argv:
+        asyncio.run(main_async())
+    elif "--webhook" in sys.argv:
+        main_webhook()
+    else:
+        main()
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.async_telebot import AsyncTeleBot
+
+from sp_tools.job_queue import JOB_EFFECT_RENDER
+
+logger = logging.getLogger(__name__)
+
+# Задачі, що впираються в мережу, і задачі, що впираються в CPU (згортка 8D), виконуються окремо.
+# ffmpeg у задачах завантаження додатково обмежений спільними слотами з sp_tools.transcode
+IO_WORKERS = 16
+CPU_WORKERS = os.cpu_count() or 2
+CPU_BOUND_JOBS = {JOB_EFFECT_RENDER}
+ASYNC_JOB_CONCURRENCY = IO_WORKERS + CPU_WORKERS
+CLAIM_TIMEOUT = 1.0
+
+
+class UpdateBridgeBot(AsyncTeleBot):
+    """
+    AsyncTeleBot, який отримує оновлення через asyncio і передає їх обробникам,
+    зареєстрованим на синхронному боті (разом з register_next_step_handler),
+    тож обидва режими запуску використовують одні й ті самі обробники.
+    Синхронний TeleBot сам виконує обробники у своєму пулі потоків, тому виклик не блокує цикл.
+    """
+
+    def __init__(self, sync_bot):
+        super().__init__(sync_bot.token)
+        self.sync_bot = sync_bot
+
+    async def process_new_updates(self, updates):
+        self.sync_bot.process_new_updates(updates)
+
+
+class AsyncJobRunner:
+    """
+    Виконує задачі з черги як asyncio-задачі: одночасно до concurrency задач, кожна
+    в пулі за своїм типом. Кількість потоків не залежить від кількості користувачів —
+    решта задач чекає в черзі.
+    """
+
+    def __init__(self, queue, handlers, concurrency=ASYNC_JOB_CONCURRENCY):
+        self.queue = queue
+        self.handlers = handlers  # {kind: функція(job)}
+        self.concurrency = concurrency
+        self.io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="async-io")
+        self.cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="async-cpu")
+        self.claim_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="async-claim")
+        self.tasks = set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.concurrency)
+        logger.info(f"Started async job runner ({self.concurrency} concurrent jobs)")
+
+        while True:
+            await slots.acquire()
+            job = await loop.run_in_executor(self.claim_executor, self.queue.claim, CLAIM_TIMEOUT)
+            if job is None:
+                slots.release()
+                continue
+
+            task = asyncio.create_task(self._run_job(job, slots))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run_job(self, job, slots):
+        loop = asyncio.get_running_loop()
+        try:
+            handler = self.handlers.get(job.kind)
+            if handler is None:
+                logger.error(f"No handler for job kind {job.kind}")
+                self.queue.fail(job, "unknown job kind")
+                return
+
+            executor = self.cpu_executor if job.kind in CPU_BOUND_JOBS else self.io_executor
+            try:
+                await loop.run_in_executor(executor, handler, job)
+            except Exception as e:
+                logger.exception(f"Job {job.id} ({job.kind}) failed: {str(e)}")
+                self.queue.fail(job, e)
+            else:
+                self.queue.complete(job)
+        finally:
+            slots.release()
+
+
+async def run_async_bot(sync_bot, queue, handlers):
+    """Отримання оновлень і виконання задач в одному циклі asyncio"""
+    async_bot = UpdateBridgeBot(sync_bot)
+    runner = AsyncJobRunner(queue, handlers)
+    await asyncio.gather(runner.run(), async_bot.infinity_polling())
@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+AUDIO_CACHE_DIR = "cache/audio"
+# Максимальний розмір кешу на диску (байти)
+AUDIO_CACHE_MAX_BYTES = 5 * 1024 * 1024 * 1024
+
+
+class AudioCache:
+    """
+    Кеш готових (перекодованих і протегованих) аудіофайлів на диску.
+    Ключ — (videoId YouTube, формат, профіль якості), файли видаляються за принципом LRU,
+    коли загальний розмір перевищує max_bytes.
+    """
+
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self._scan())
+
+    @staticmethod
+    def make_key(video_id, audio_format, profile):
+        return hashlib.sha256(f"{video_id}|{audio_format}|{profile}".encode("utf-8")).hexdigest()
+
+    def _path(self, key, audio_format):
+        return os.path.join(self.directory, key[:2], f"{key}.{audio_format}")
+
+    def _scan(self):
+        """Повертає (шлях, розмір, час останнього використання) для всіх файлів кешу"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".part"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, video_id, audio_format, profile):
+        """Повертає шлях до файлу в кеші або None"""
+        path = self._path(self.make_key(video_id, audio_format, profile), audio_format)
+        with self.lock:
+            if not os.path.exists(path):
+                self.misses += 1
+                return None
+            self.hits += 1
+            # mtime використовуємо як час останнього звернення для LRU
+            now = time.time()
+            os.utime(path, (now, now))
+            return path
+
+    def fetch(self, video_id, audio_format, profile, destination):
+        """Копіює файл з кешу в destination. Повертає True при попаданні в кеш"""
+        path = self.get(video_id, audio_format, profile)
+        if not path:
+            return False
+
+        try:
+            if os.path.exists(destination):
+                os.remove(destination)
+            # Жорстке посилання створюється миттєво; якщо інший диск — копіюємо
+            os.link(path, destination)
+        except OSError:
+            try:
+                shutil.copyfile(path, destination)
+            except OSError as e:
+                logger.warning(f"Audio cache read failed for {video_id}: {str(e)}")
+                return False
+        logger.info(f"Audio cache hit: {video_id} ({audio_format}, {profile})")
+        return True
+
+    def put(self, video_id, audio_format, profile, source_path):
+        """Атомарно зберігає готовий файл у кеш"""
+        path = self._path(self.make_key(video_id, audio_format, profile), audio_format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Пишемо у тимчасовий файл у тій самій папці і перейменовуємо — інші потоки
+        # ніколи не побачать напівзаписаний файл
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as temp_file, open(source_path, "rb") as source:
+                shutil.copyfileobj(source, temp_file)
+            size = os.path.getsize(temp_path)
+            with self.lock:
+                previous = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(temp_path, path)
+                self.total_bytes += size - previous
+        except Exception as e:
+            logger.warning(f"Audio cache write failed for {video_id}: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Видаляє найдавніше використані файли, поки кеш не вміститься в ліміт"""
+        with self.lock:
+            entries = sorted(self._scan(), key=lambda entry: entry[2])
+            self.total_bytes = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self.total_bytes -= size
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            requests_total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests_total if requests_total else 0.0,
+                "evictions": self.evictions,
+                "size_bytes": self.total_bytes,
+            }
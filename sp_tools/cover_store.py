@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+from sp_tools.http_sessions import get_session
+from sp_tools.transcode import FFMPEG_BINARY
+
+logger = logging.getLogger(__name__)
+
+COVER_STORE_DIR = "cache/covers"
+# Обкладинка, що вбудовується в теги, і мініатюра для send_audio (Telegram: JPEG до 320px і 200 КБ)
+EMBED_MAX_SIZE = 640
+THUMB_MAX_SIZE = 320
+THUMB_MAX_BYTES = 200 * 1024
+# Через скільки секунд перевіряти, чи не змінилась обкладинка на сервері (умовний GET)
+REVALIDATE_AFTER = 7 * 24 * 3600
+REQUEST_TIMEOUT = 10
+# Кількість блокувань, між якими розподіляються альбоми (пам'ять не росте з кількістю альбомів)
+LOCK_STRIPES = 64
+
+
+def choose_image(images, max_size):
+    """
+    Вибирає з переліку зображень Spotify ([{url, width, height}]) найбільше, що вміщується
+    в max_size (для альбомів це 640 і 300), інакше найменше з більших.
+    """
+    images = [image for image in images if image.get('url')]
+    if not images:
+        return None
+    fitting = [image for image in images if 0 < (image.get('width') or 0) <= max_size]
+    if fitting:
+        return max(fitting, key=lambda image: image['width'])
+    return min(images, key=lambda image: image.get('width') or 0)
+
+
+def resize_image(image_data, output_path, max_size):
+    """
+    Зменшує зображення через ffmpeg до max_size по більшій стороні. Як і _write_atomic,
+    пише в тимчасовий файл поруч і підміняє ним output_path, тож get не прочитає недописаний JPEG
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(output_path), suffix=".part.jpg")
+    os.close(fd)
+    command = [
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", "-i", "pipe:0",
+        "-vf", f"scale={max_size}:{max_size}:force_original_aspect_ratio=decrease",
+        "-q:v", "4", temp_path
+    ]
+    try:
+        result = subprocess.run(command, input=image_data, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode("utf-8", errors="replace")[-300:])
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _write_atomic(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    with os.fdopen(fd, "wb") as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+
+class CoverStore:
+    """
+    Сховище обкладинок за ID альбому. Для кожного альбому зберігається версія для тегів
+    (не більше EMBED_MAX_SIZE) і мініатюра для Telegram. Повторні треки того самого альбому
+    не роблять HTTP-запитів, а застарілі записи перевіряються умовним GET (ETag/Last-Modified).
+    """
+
+    def __init__(self, directory=COVER_STORE_DIR):
+        self.directory = directory
+        self.session = get_session("covers")
+        self.locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        os.makedirs(directory, exist_ok=True)
+
+    def _album_lock(self, album_id):
+        return self.locks[hash(album_id) % LOCK_STRIPES]
+
+    def _paths(self, album_id):
+        folder = os.path.join(self.directory, album_id)
+        return (folder, os.path.join(folder, "embed.jpg"), os.path.join(folder, "thumb.jpg"),
+                os.path.join(folder, "meta.json"))
+
+    def _download(self, url, meta):
+        """Завантажує зображення; повертає (bytes або None якщо не змінилось, оновлені заголовки)"""
+        headers = {}
+        if meta.get("url") == url:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            return None, meta
+        response.raise_for_status()
+        return response.content, {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+    def _refresh(self, album_id, images):
+        folder, embed_path, thumb_path, meta_path = self._paths(album_id)
+        os.makedirs(folder, exist_ok=True)
+
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as file:
+                meta = json.load(file)
+
+        fresh = time.time() - meta.get("checked_at", 0) < REVALIDATE_AFTER
+        if fresh and os.path.exists(embed_path) and os.path.exists(thumb_path):
+            return
+
+        image = choose_image(images, EMBED_MAX_SIZE)
+        if not image:
+            return
+
+        image_data, new_meta = self._download(image['url'], meta if os.path.exists(embed_path) else {})
+        if image_data is not None:
+            if (image.get('width') or 0) > EMBED_MAX_SIZE:
+                resize_image(image_data, embed_path, EMBED_MAX_SIZE)
+            else:
+                _write_atomic(embed_path, image_data)
+            self._build_thumbnail(images, embed_path, thumb_path)
+        elif not os.path.exists(thumb_path):
+            self._build_thumbnail(images, embed_path, thumb_path)
+
+        new_meta["checked_at"] = time.time()
+        _write_atomic(meta_path, json.dumps(new_meta).encode("utf-8"))
+
+    def _build_thumbnail(self, images, embed_path, thumb_path):
+        """Мініатюра створюється один раз: готовий менший розмір від Spotify або зменшена копія"""
+        image = choose_image(images, THUMB_MAX_SIZE)
+        if image and 0 < (image.get('width') or 0) <= THUMB_MAX_SIZE:
+            response = self.session.get(image['url'], timeout=REQUEST_TIMEOUT)
+            if response.status_code == 200 and len(response.content) <= THUMB_MAX_BYTES:
+                _write_atomic(thumb_path, response.content)
+                return
+
+        with open(embed_path, "rb") as file:
+            resize_image(file.read(), thumb_path, THUMB_MAX_SIZE)
+
+    def get(self, album_id, images):
+        """Повертає (bytes обкладинки для тегів, шлях до мініатюри) або (None, None)"""
+        if not album_id or not images:
+            return None, None
+
+        _, embed_path, thumb_path, _ = self._paths(album_id)
+        with self._album_lock(album_id):
+            try:
+                self._refresh(album_id, images)
+            except Exception as e:
+                logger.warning(f"Cover refresh failed for album {album_id}: {str(e)}")
+
+        if not os.path.exists(embed_path):
+            return None, None
+        with open(embed_path, "rb") as file:
+            cover_image_data = file.read()
+        return cover_image_data, thumb_path if os.path.exists(thumb_path) else None
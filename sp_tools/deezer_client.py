@@ -0,0 +1,90 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from sp_tools.http_sessions import get_session
+from sp_tools.ttl_cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+DEEZER_API_URL = "https://api.deezer.com"
+DEEZER_PAGE_SIZE = 100
+DEEZER_PAGE_WORKERS = 4
+REQUEST_TIMEOUT = 10
+# Час життя записів (секунди): плейлисти змінюються, треки — ні
+PLAYLIST_TTL = 10 * 60
+TRACK_TTL = 24 * 3600
+
+
+class DeezerError(Exception):
+    """Помилка, яку Deezer API повертає в тілі відповіді ({"error": {...}})"""
+
+
+def make_deezer_track_record(track):
+    """Компактний запис треку Deezer у тому ж форматі, що й записи плейлистів Spotify"""
+    album = track.get('album') or {}
+    covers = [("cover_xl", 1000), ("cover_big", 500), ("cover_medium", 250)]
+    return {
+        "deezer_id": track['id'],
+        "name": track['title'],
+        "artist": (track.get('artist') or {}).get('name') or "",
+        "album": album.get('title'),
+        # Префікс відділяє альбоми Deezer від альбомів Spotify у сховищі обкладинок
+        "album_id": f"dz-{album['id']}" if album.get('id') else None,
+        "isrc": track.get('isrc'),
+        "duration_ms": track['duration'] * 1000 if track.get('duration') else None,
+        "cover_images": [{"url": album[field], "width": width} for field, width in covers if album.get(field)],
+    }
+
+
+class DeezerClient:
+    """
+    Спільний клієнт Deezer API на сесії "deezer" з реєстру HTTP-сесій (пул з'єднань).
+    Сторінки плейлиста завантажуються паралельно, плейлисти і треки кешуються з TTL.
+    """
+
+    def __init__(self, page_workers=DEEZER_PAGE_WORKERS):
+        self.session = get_session("deezer")
+        self.executor = ThreadPoolExecutor(max_workers=page_workers, thread_name_prefix="deezer")
+        self.cache = TTLCache(max_entries=5000, default_ttl=TRACK_TTL)
+
+    def _get(self, path, **params):
+        response = self.session.get(f"{DEEZER_API_URL}/{path}", params=params, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+        if isinstance(data, dict) and data.get('error'):
+            raise DeezerError(data['error'].get('message') or str(data['error']))
+        return data
+
+    def get_track(self, track_id):
+        """Повертає компактний запис треку (з ISRC і тривалістю)"""
+        key = ("track", str(track_id))
+        record = self.cache.get(key)
+        if record is MISSING:
+            record = make_deezer_track_record(self._get(f"track/{track_id}"))
+            self.cache.set(key, record, TRACK_TTL)
+        return record
+
+    def _get_playlist_page(self, playlist_id, index):
+        return self._get(f"playlist/{playlist_id}/tracks", index=index, limit=DEEZER_PAGE_SIZE)
+
+    def get_playlist_tracks(self, playlist_id):
+        """
+        Повертає всі треки плейлиста. Перша сторінка дає загальну кількість,
+        решта сторінок запитується одночасно.
+        """
+        key = ("playlist", str(playlist_id))
+        records = self.cache.get(key)
+        if records is not MISSING:
+            return list(records)
+
+        first_page = self._get_playlist_page(playlist_id, 0)
+        total = first_page.get('total', 0)
+        indexes = range(DEEZER_PAGE_SIZE, total, DEEZER_PAGE_SIZE)
+        pages = [first_page] + list(self.executor.map(lambda index: self._get_playlist_page(playlist_id, index),
+                                                      indexes))
+
+        # У переліках Deezer немає ISRC — він є лише в запитах окремих треків,
+        # тому для плейлистів ключами відповідностей залишаються ID Deezer і назва
+        records = [make_deezer_track_record(track) for page in pages for track in page.get('data', [])]
+        self.cache.set(key, records, PLAYLIST_TTL)
+        return list(records)
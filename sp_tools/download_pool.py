@@ -0,0 +1,185 @@
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from sp_tools.progress_dispatcher import get_progress_dispatcher
+
+logger = logging.getLogger(__name__)
+
+# Кількість треків, які завантажуються одночасно, якщо користувач нічого не вибрав
+DEFAULT_DOWNLOAD_WORKERS = 4
+# Найбільша кількість потоків завантаження в одній задачі (налаштування !потоки)
+MAX_DOWNLOAD_WORKERS = 8
+# Загальна межа одночасних завантажень у процесі для всіх задач і користувачів:
+# кожне завантаження запускає yt-dlp і ffmpeg, які навантажують CPU та канал
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get("MAX_CONCURRENT_DOWNLOADS", 8))
+download_slots = threading.BoundedSemaphore(MAX_CONCURRENT_DOWNLOADS)
+
+# Індивідуальні налаштування кількості потоків {user_id: workers}
+user_download_workers = {}
+
+
+def get_worker_count(user_id):
+    """Повертає кількість потоків завантаження для користувача"""
+    workers = user_download_workers.get(user_id, DEFAULT_DOWNLOAD_WORKERS)
+    return max(1, min(int(workers), MAX_DOWNLOAD_WORKERS))
+
+
+def set_worker_count(user_id, workers):
+    """Зберігає кількість потоків для користувача з урахуванням глобальної межі"""
+    workers = max(1, min(int(workers), MAX_DOWNLOAD_WORKERS))
+    user_download_workers[user_id] = workers
+    return workers
+
+
+def get_track_display_name(track):
+    """Повертає назву треку у форматі 'Виконавець - Назва' для Spotify/Deezer та YouTube"""
+    if track.get('is_youtube'):
+        return f"{track['author']} - {track['title']}"
+    return f"{track['artist']} - {track['name']}"
+
+
+class PlaylistProgress:
+    """
+    Одне повідомлення із загальним прогресом завантаження плейлиста.
+    Редагування об'єднуються диспетчером прогресу, тому оновлювати можна з будь-якого потоку.
+    """
+
+    def __init__(self, bot, chat_id, message_id, total_tracks, title="Завантаження плейлиста"):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.total_tracks = total_tracks
+        self.title = title
+        self.completed = 0
+        self.failed = 0
+        self.track_progress = {}  # {index: відсоток}
+        self.active = {}  # {index: назва треку}
+        self.lock = threading.Lock()
+
+    def track_started(self, index, track_name):
+        with self.lock:
+            self.active[index] = track_name
+            self.track_progress[index] = 0
+        self.refresh()
+
+    def track_updated(self, index, progress):
+        with self.lock:
+            self.track_progress[index] = progress
+        self.refresh()
+
+    def track_finished(self, index, success=True):
+        with self.lock:
+            self.active.pop(index, None)
+            self.track_progress.pop(index, None)
+            if success:
+                self.completed += 1
+            else:
+                self.failed += 1
+        self.refresh()
+
+    def finish(self):
+        """Надсилає кінцевий стан після завершення всіх треків"""
+        self.refresh(final=True)
+
+    def render(self):
+        """Формує текст повідомлення з прогрес-баром"""
+        with self.lock:
+            finished = self.completed + self.failed
+            partial = sum(self.track_progress.values()) / 100
+            active = list(self.active.values())
+
+        total = max(self.total_tracks, 1)
+        percent = int((finished + partial) / total * 100)
+        filled_blocks = int(percent / 10)
+        progress_bar = f"[{'■' * filled_blocks}{'□' * (10 - filled_blocks)}] {percent}%"
+
+        icon = "✅" if finished >= self.total_tracks else "⏳"
+        text = f"{icon} {self.title}\n{progress_bar}\nГотово: {self.completed}/{self.total_tracks}"
+        if self.failed:
+            text += f", помилок: {self.failed}"
+        if active:
+            text += "\n\nЗараз завантажуються:\n" + "\n".join(f"• {name}" for name in active)
+        return text
+
+    def refresh(self, final=False):
+        get_progress_dispatcher(self.bot).update(self.chat_id, self.message_id, self.render(), final=final)
+
+
+class TrackProgress:
+    """
+    Замінник DownloadProgress для треку всередині плейлиста.
+    Не надсилає окремих повідомлень, а передає прогрес у PlaylistProgress.
+    """
+
+    def __init__(self, playlist_progress, index, track_name):
+        self.playlist_progress = playlist_progress
+        self.index = index
+        self.track_name = track_name
+        self.status_message = None
+        self.progress = 0
+
+    def send_initial_message(self):
+        if self.playlist_progress:
+            self.playlist_progress.track_started(self.index, self.track_name)
+
+    def update_progress(self, progress):
+        if progress != self.progress:
+            self.progress = progress
+            if self.playlist_progress:
+                self.playlist_progress.track_updated(self.index, progress)
+
+    def complete(self):
+        pass
+
+
+def _run_download(download_func, index, track, playlist_progress):
+    """Завантажує один трек у потоці пулу і повертає (результат, помилка)"""
+    progress = TrackProgress(playlist_progress, index, get_track_display_name(track))
+    try:
+        with download_slots:
+            # Трек позначається розпочатим, лише коли отримав слот, а не поки чекає на нього
+            progress.send_initial_message()
+            result = download_func(track, progress)
+    except Exception as e:
+        logger.exception(f"Error downloading track {progress.track_name}: {str(e)}")
+        if playlist_progress:
+            playlist_progress.track_finished(index, success=False)
+        return None, e
+
+    if playlist_progress:
+        playlist_progress.track_finished(index, success=True)
+    return result, None
+
+
+def iter_downloads_ordered(tracks, download_func, workers, playlist_progress=None):
+    """
+    Завантажує треки пулом з workers потоків і повертає результати в порядку плейлиста.
+
+    download_func(track, progress) має повернути шлях до готового файлу.
+    Генерує кортежі (index, track, result, error). Одночасно в черзі пулу тримається
+    не більше workers * 2 треків, тому tracks може бути й лінивим генератором.
+    """
+    workers = max(1, workers)
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download") as executor:
+        for index, track in enumerate(tracks):
+            future = executor.submit(_run_download, download_func, index, track, playlist_progress)
+            pending.append((index, track, future))
+
+            # Віддаємо готові результати одразу, щоб надсилання йшло паралельно із завантаженням
+            while pending and (len(pending) >= workers * 2 or pending[0][2].done()):
+                index, track, future = pending.popleft()
+                result, error = future.result()
+                yield index, track, result, error
+
+        while pending:
+            index, track, future = pending.popleft()
+            result, error = future.result()
+            yield index, track, result, error
+
+    if playlist_progress:
+        playlist_progress.finish()
@@ -0,0 +1,63 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Потоки для мережевих запитів метаданих (Spotify, обкладинки, тексти пісень)
+ENRICHMENT_WORKERS = 8
+# Скільки секунд від початку збагачення можна чекати на кожен результат
+METADATA_TIMEOUT = 10
+LYRICS_TIMEOUT = 12
+
+enrichment_executor = ThreadPoolExecutor(max_workers=ENRICHMENT_WORKERS, thread_name_prefix="enrichment")
+
+
+class TrackEnrichment:
+    """
+    Метадані треку, які збираються паралельно із завантаженням і перекодуванням аудіо.
+    join() чекає на результати не довше за свої дедлайни, тому повільний провайдер
+    текстів не затримує надсилання треку.
+    """
+
+    def __init__(self, track_name, metadata_future, lyrics_future):
+        self.track_name = track_name
+        self.metadata_future = metadata_future
+        self.lyrics_future = lyrics_future
+        self.started = time.monotonic()
+        # False, якщо якийсь результат не встиг або завершився помилкою
+        self.complete = True
+
+    def _wait(self, future, timeout, what):
+        remaining = max(0.0, self.started + timeout - time.monotonic())
+        try:
+            return future.result(timeout=remaining)
+        except TimeoutError:
+            logger.warning(f"{what} for {self.track_name} did not arrive in {timeout}s, skipping")
+            future.cancel()
+        except Exception as e:
+            logger.warning(f"{what} for {self.track_name} failed: {str(e)}")
+        self.complete = False
+        return None
+
+    def join(self, metadata_timeout=METADATA_TIMEOUT, lyrics_timeout=LYRICS_TIMEOUT):
+        """Повертає (метадані, текст пісні); те, що не встигло, повертається як None"""
+        metadata = self._wait(self.metadata_future, metadata_timeout, "Metadata")
+        lyrics = self._wait(self.lyrics_future, lyrics_timeout, "Lyrics")
+        return metadata, lyrics
+
+    def cancel(self):
+        """Скасовує ще не розпочаті запити (наприклад, коли файл знайдено в кеші)"""
+        self.metadata_future.cancel()
+        self.lyrics_future.cancel()
+
+
+def start_enrichment(track, lookup_metadata, fetch_lyrics):
+    """
+    Запускає пошук метаданих і тексту пісні у фоні.
+    lookup_metadata(track) і fetch_lyrics(track) виконуються паралельно між собою.
+    """
+    track_name = f"{track['artist']} - {track['name']}"
+    metadata_future = enrichment_executor.submit(lookup_metadata, track)
+    lyrics_future = enrichment_executor.submit(fetch_lyrics, track)
+    return TrackEnrichment(track_name, metadata_future, lyrics_future)
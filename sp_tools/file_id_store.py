@@ -0,0 +1,105 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import telebot
+
+logger = logging.getLogger(__name__)
+
+FILE_ID_STORE_PATH = "cache/file_ids.sqlite3"
+
+
+def make_track_key(track, audio_format, profile=""):
+    """Ключ для треку: джерело + ідентифікатор + формат + профіль обробки"""
+    # Трек, відкритий за посиланням, має лише url, а той самий трек з плейлиста — id
+    spotify_match = re.search(r'track/([a-zA-Z0-9]+)', track.get('url') or "")
+    if track.get('is_youtube'):
+        source = f"yt:{track['url']}"
+    elif track.get('id') or spotify_match:
+        source = f"sp:{track.get('id') or spotify_match.group(1)}"
+    else:
+        source = f"name:{track['artist'].strip().lower()} - {track['name'].strip().lower()}"
+    return f"{source}|{audio_format}|{profile}"
+
+
+def make_effect_key(file_unique_id, effect, *params):
+    """
+    Ключ для обробленого ефектом файлу, надісланого користувачем. Використовується
+    file_unique_id: file_id того самого файлу може відрізнятися між користувачами
+    """
+    return "|".join(["effect", file_unique_id, effect] + [str(param) for param in params])
+
+
+class TelegramFileIdStore:
+    """
+    Постійне сховище file_id вже надісланих аудіофайлів.
+    Telegram дозволяє повторно надіслати файл за file_id без завантаження,
+    тому повторний запит того самого треку — це один виклик API.
+    """
+
+    def __init__(self, db_path=FILE_ID_STORE_PATH):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS file_ids (
+                key TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                uses INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self.connection.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT file_id FROM file_ids WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def remember(self, key, message):
+        """Зберігає file_id з повідомлення, яке повернув send_audio/send_document"""
+        media = getattr(message, "audio", None) or getattr(message, "document", None)
+        if not media:
+            return
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO file_ids (key, file_id, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, media.file_id, now, now)
+            )
+            self.connection.commit()
+
+    def forget(self, key):
+        with self.lock:
+            self.connection.execute("DELETE FROM file_ids WHERE key = ?", (key,))
+            self.connection.commit()
+
+    def send_cached_audio(self, bot, chat_id, key, **kwargs):
+        """
+        Надсилає аудіо за збереженим file_id. Повертає повідомлення або None,
+        якщо file_id немає чи Telegram його більше не приймає.
+        """
+        file_id = self.get(key)
+        if not file_id:
+            return None
+
+        try:
+            message = bot.send_audio(chat_id=chat_id, audio=file_id, **kwargs)
+        except telebot.apihelper.ApiTelegramException as e:
+            logger.warning(f"Cached file_id rejected for {key}: {str(e)}")
+            self.forget(key)
+            return None
+
+        with self.lock:
+            self.connection.execute(
+                "UPDATE file_ids SET last_used = ?, uses = uses + 1 WHERE key = ?", (time.time(), key)
+            )
+            self.connection.commit()
+        logger.info(f"Sent cached file_id for {key}")
+        return message
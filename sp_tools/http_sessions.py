@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Налаштування сесій: розмір пулу з'єднань на хост, таймаути (з'єднання, читання) і повтори.
+# Повтори за статусом робляться лише для ідемпотентних запитів; помилки з'єднання повторюються для всіх.
+# Для Telegram 429 обробляє RateLimitedBot, тому там повторюються лише помилки з'єднання
+SESSION_PROFILES = {
+    "default": {"pool_maxsize": 10, "timeout": (5, 30), "retries": 3},
+    "telegram": {"pool_maxsize": 32, "timeout": (10, 300), "retries": 2, "retry_statuses": ()},
+    "youtube": {"pool_maxsize": 8, "timeout": (5, 15), "retries": 3},
+    "ytmusic": {"pool_maxsize": 16, "timeout": (5, 20), "retries": 3},
+    "spotify": {"pool_maxsize": 16, "timeout": (5, 20), "retries": 3},
+    "covers": {"pool_maxsize": 16, "timeout": (5, 15), "retries": 3},
+    "deezer": {"pool_maxsize": 8, "timeout": (5, 15), "retries": 3},
+}
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_BACKOFF = 0.5
+RETRY_JITTER = 0.5
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter з таймаутом за замовчуванням для запитів, які не вказали власний"""
+
+    def __init__(self, timeout, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class HostStats:
+    __slots__ = ("requests", "errors", "total_latency", "max_latency")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+
+class SessionRegistry:
+    """
+    Спільні requests.Session за назвою профілю. Кожна сесія тримає keep-alive пул
+    з'єднань на хост, тож повторні запити не платять за DNS, TCP і TLS. Для кожного
+    хоста збирається затримка, а з пулів urllib3 — частка повторно використаних з'єднань.
+    """
+
+    def __init__(self, profiles=SESSION_PROFILES):
+        self.profiles = profiles
+        self.sessions = {}
+        self.adapters = {}
+        self.host_stats = {}
+        self.lock = threading.Lock()
+
+    def get(self, name="default"):
+        with self.lock:
+            session = self.sessions.get(name)
+            if session is None:
+                session = self.sessions[name] = self._create(name)
+            return session
+
+    def _create(self, name):
+        profile = self.profiles.get(name, self.profiles["default"])
+        retry = Retry(
+            total=profile["retries"],
+            backoff_factor=RETRY_BACKOFF,
+            backoff_jitter=RETRY_JITTER,
+            status_forcelist=profile.get("retry_statuses", RETRY_STATUSES),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = TimeoutHTTPAdapter(
+            profile["timeout"],
+            pool_connections=4,
+            pool_maxsize=profile["pool_maxsize"],
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.hooks["response"].append(self._record_response)
+        self.adapters[name] = adapter
+        return session
+
+    def _record_response(self, response, *args, **kwargs):
+        host = urlsplit(response.url).hostname
+        latency = response.elapsed.total_seconds()
+        with self.lock:
+            stats = self.host_stats.get(host)
+            if stats is None:
+                stats = self.host_stats[host] = HostStats()
+            stats.requests += 1
+            stats.total_latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
+            if response.status_code >= 500 or response.status_code == 429:
+                stats.errors += 1
+
+    def _connection_reuse(self):
+        """Повертає {профіль: (нових з'єднань, запитів)} з лічильників пулів urllib3"""
+        reuse = {}
+        for name, adapter in self.adapters.items():
+            connections = requests_count = 0
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+                    requests_count += pool.num_requests
+            reuse[name] = (connections, requests_count)
+        return reuse
+
+    def stats(self):
+        with self.lock:
+            hosts = {
+                host: {
+                    "requests": stats.requests,
+                    "errors": stats.errors,
+                    "average_latency": stats.total_latency / stats.requests if stats.requests else 0.0,
+                    "max_latency": stats.max_latency,
+                }
+                for host, stats in self.host_stats.items()
+            }
+            sessions = {
+                name: {
+                    "connections": connections,
+                    "requests": requests_count,
+                    "reuse_rate": 1 - connections / requests_count if requests_count else 0.0,
+                }
+                for name, (connections, requests_count) in self._connection_reuse().items()
+            }
+        return {"hosts": hosts, "sessions": sessions, "collected_at": time.time()}
+
+
+session_registry = SessionRegistry()
+
+
+def get_session(name="default"):
+    return session_registry.get(name)
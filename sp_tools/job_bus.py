@@ -0,0 +1,380 @@
+import itertools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+from sp_tools.job_queue import Job, PRIORITY_ADMIN, PRIORITY_SINGLE, PRIORITY_PLAYLIST
+
+logger = logging.getLogger(__name__)
+
+JOB_STREAM_PREFIX = "spbot:jobs"
+JOB_GROUP = "workers"
+PRIORITIES = (PRIORITY_ADMIN, PRIORITY_SINGLE, PRIORITY_PLAYLIST)
+# Задача, яку виконавець не підтвердив за цей час (процес упав), видається іншому виконавцю.
+# Поки задача виконується, виконавець продовжує її кожні VISIBILITY_TIMEOUT / 3 секунд
+VISIBILITY_TIMEOUT = 300
+# Після стількох видач задача вважається отруйною і переноситься в dead-letter
+MAX_DELIVERIES = 3
+EVENTS_MAXLEN = 10000
+DEAD_LETTER_MAXLEN = 10000
+# Події задач, що публікуються на шину: виконавець узяв задачу, виконав, помилка, dead-letter
+EVENT_CLAIMED = "claimed"
+EVENT_DONE = "done"
+EVENT_FAILED = "failed"
+EVENT_DEAD = "dead"
+
+
+def make_consumer_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _job_fields(kind, user_id, payload, priority, attempts=0):
+    return {
+        "kind": kind,
+        "user_id": str(user_id),
+        "priority": str(priority),
+        "payload": json.dumps(payload, ensure_ascii=False),
+        "attempts": str(attempts),
+    }
+
+
+def _job_from_fields(job_id, fields, deliveries):
+    return Job(job_id, fields["kind"], int(fields["user_id"]), int(fields["priority"]),
+               json.loads(fields["payload"]), deliveries)
+
+
+class JobBusBase:
+    """
+    Спільна частина шин задач: інтерфейс той самий, що в JobQueue (enqueue, position,
+    pending_count, claim, complete, fail), тож JobWorkerPool працює з будь-якою з них.
+    Поки задача виконується, фоновий потік продовжує її видимість.
+    """
+
+    def __init__(self, visibility_timeout=VISIBILITY_TIMEOUT, max_deliveries=MAX_DELIVERIES):
+        self.visibility_timeout = visibility_timeout
+        self.max_deliveries = max_deliveries
+        self.in_progress = {}  # {job_id: Job}
+        self.in_progress_lock = threading.Lock()
+        self.heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-bus-heartbeat", daemon=True)
+        self.heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.visibility_timeout / 3)
+            with self.in_progress_lock:
+                job_ids = list(self.in_progress)
+            if job_ids:
+                try:
+                    self._extend(job_ids)
+                except Exception as e:
+                    logger.warning(f"Failed to extend job visibility: {str(e)}")
+
+    def _track(self, job):
+        with self.in_progress_lock:
+            self.in_progress[job.id] = job
+
+    def _untrack(self, job):
+        with self.in_progress_lock:
+            self.in_progress.pop(job.id, None)
+
+    def event_payload(self, job, status, detail=None):
+        return {
+            "job_id": job.id,
+            "kind": job.kind,
+            "user_id": str(job.user_id),
+            "chat_id": str(job.payload.get("chat_id", "")),
+            "status": status,
+            "detail": detail or "",
+        }
+
+    def claim(self, timeout=None):
+        """Блокує потік до появи задачі (або до timeout) і повертає її"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self._reclaim_expired() or self._read_next(deadline)
+            if job:
+                self._track(job)
+                self.publish_event(job, EVENT_CLAIMED)
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def complete(self, job):
+        self._untrack(job)
+        self._ack(job)
+        self.publish_event(job, EVENT_DONE)
+
+    def fail(self, job, error):
+        """Як і в JobQueue, помилка обробника остаточна: задача йде в dead-letter для розбору"""
+        self._untrack(job)
+        self._dead_letter(job, str(error))
+        self.publish_event(job, EVENT_FAILED, str(error))
+
+
+class RedisJobBus(JobBusBase):
+    """
+    Шина задач на Redis Streams: окремий потік для кожної пріоритетної смуги, група
+    споживачів для виконавців у будь-якій кількості процесів чи хостів, XAUTOCLAIM для задач
+    упалих виконавців і потік dead-letter. Події задач публікуються в потік подій, який
+    читає фронтенд бота.
+    """
+
+    def __init__(self, redis_client, prefix=JOB_STREAM_PREFIX, group=JOB_GROUP, consumer=None, **kwargs):
+        import redis  # Потрібен лише в режимі Redis
+        self.redis = redis_client
+        self.group = group
+        self.consumer = consumer or make_consumer_name()
+        self.streams = {priority: f"{prefix}:{priority}" for priority in PRIORITIES}
+        self.dead_stream = f"{prefix}:dead"
+        self.events_stream = f"{prefix}:events"
+        for stream in self.streams.values():
+            try:
+                self.redis.xgroup_create(stream, group, id="0", mkstream=True)
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def _split_id(job_id):
+        priority, entry_id = job_id.split("/")[:2]
+        return int(priority), entry_id
+
+    def _group_info(self, stream, groups=None):
+        if groups is None:
+            groups = self.redis.xinfo_groups(stream)
+        return next(group for group in groups if group["name"] == self.group)
+
+    def enqueue(self, kind, user_id, payload, priority=PRIORITY_SINGLE):
+        stream = self.streams[priority]
+        pipeline = self.redis.pipeline()
+        pipeline.xadd(stream, _job_fields(kind, user_id, payload, priority))
+        pipeline.xinfo_groups(stream)
+        entry_id, groups = pipeline.execute()
+        group = self._group_info(stream, groups)
+        if group.get("entries-read") is None or group.get("lag") is None:
+            return f"{priority}/{entry_id}"
+        # Порядковий номер запису в смузі (entries-added одразу після XADD): за ним position
+        # рахує задачі попереду, не читаючи самих записів
+        return f"{priority}/{entry_id}/{group['entries-read'] + group['lag']}"
+
+    def _last_delivered(self, stream):
+        return self._group_info(stream)["last-delivered-id"]
+
+    def _undelivered(self, stream, group=None):
+        """Скільки записів смуги ще не видано групі. Самі записи (з payload) не читаються"""
+        group = group or self._group_info(stream)
+        if group.get("lag") is not None:
+            return group["lag"]
+        # lag недоступний (Redis < 7). Виконані задачі видаляються з потоку, тож у ньому
+        # лишаються тільки видані без підтвердження та ще не видані
+        return max(self.redis.xlen(stream) - self.redis.xpending(stream, self.group)["pending"], 0)
+
+    def position(self, job_id):
+        priority, _ = self._split_id(job_id)
+        ahead = sum(self._undelivered(self.streams[p]) for p in PRIORITIES if p < priority)
+        group = self._group_info(self.streams[priority])
+        parts = job_id.split("/")
+        if len(parts) == 3 and group.get("entries-read") is not None:
+            lane_ahead = int(parts[2]) - group["entries-read"] - 1
+        else:
+            # Без порядкового номера — оцінка зверху: усі невидані записи смуги, крім цього
+            lane_ahead = self._undelivered(self.streams[priority], group) - 1
+        return ahead + max(lane_ahead, 0)
+
+    def pending_count(self):
+        return sum(self._undelivered(stream) for stream in self.streams.values())
+
+    def _deliveries(self, stream, entry_id):
+        pending = self.redis.xpending_range(stream, self.group, min=entry_id, max=entry_id, count=1)
+        return pending[0]["times_delivered"] if pending else 1
+
+    def _reclaim_expired(self):
+        """Забирає задачі, які інший виконавець узяв, але не підтвердив за visibility_timeout"""
+        for priority, stream in self.streams.items():
+            result = self.redis.xautoclaim(stream, self.group, self.consumer,
+                                           min_idle_time=self.visibility_timeout * 1000, start_id="0-0", count=1)
+            entries = result[1]
+            for entry_id, fields in entries:
+                if not fields:
+                    continue  # Запис видалено з потоку
+                job = _job_from_fields(f"{priority}/{entry_id}", fields, self._deliveries(stream, entry_id))
+                if job.attempts > self.max_deliveries:
+                    logger.error(f"Job {job.id} was delivered {job.attempts} times, moving to dead-letter")
+                    self._dead_letter(job, "too many deliveries")
+                    self.publish_event(job, EVENT_DEAD, "too many deliveries")
+                    continue
+                logger.warning(f"Reclaimed job {job.id} ({job.kind}) from a stalled worker")
+                return job
+        return None
+
+    def _read_lanes(self):
+        """Забирає одну задачу, перебираючи смуги в порядку пріоритету"""
+        for priority in PRIORITIES:
+            response = self.redis.xreadgroup(self.group, self.consumer, {self.streams[priority]: ">"}, count=1)
+            if response:
+                entry_id, fields = response[0][1][0]
+                return _job_from_fields(f"{priority}/{entry_id}", fields, int(fields.get("attempts", 0)) + 1)
+        return None
+
+    def _read_next(self, deadline):
+        job = self._read_lanes()
+        if job:
+            return job
+
+        block = 5000 if deadline is None else max(1, int((deadline - time.monotonic()) * 1000))
+        block = min(block, self.visibility_timeout * 1000 // 2)
+        # Звичайний XREAD нічого не забирає у групи: він лише чекає на записи після останнього
+        # виданого групі, а саму задачу забираємо по смугах, щоб не захопити зайвих
+        self.redis.xread({stream: self._last_delivered(stream) for stream in self.streams.values()},
+                         count=1, block=block)
+        return self._read_lanes()
+
+    def _ack(self, job):
+        # Виконані задачі видаляються з потоку, інакше payload плейлистів лишався б у Redis назавжди
+        priority, entry_id = self._split_id(job.id)
+        pipeline = self.redis.pipeline()
+        pipeline.xack(self.streams[priority], self.group, entry_id)
+        pipeline.xdel(self.streams[priority], entry_id)
+        pipeline.execute()
+
+    def _extend(self, job_ids):
+        for job_id in job_ids:
+            priority, entry_id = self._split_id(job_id)
+            # XCLAIM на себе скидає час простою, тож задача не вважатиметься покинутою
+            self.redis.xclaim(self.streams[priority], self.group, self.consumer, min_idle_time=0,
+                              message_ids=[entry_id], justid=True)
+
+    def _dead_letter(self, job, reason):
+        fields = _job_fields(job.kind, job.user_id, job.payload, job.priority, job.attempts)
+        fields.update({"job_id": job.id, "reason": reason, "failed_at": str(time.time())})
+        self.redis.xadd(self.dead_stream, fields, maxlen=DEAD_LETTER_MAXLEN, approximate=True)
+        self._ack(job)
+
+    def publish_event(self, job, status, detail=None):
+        self.redis.xadd(self.events_stream, self.event_payload(job, status, detail),
+                        maxlen=EVENTS_MAXLEN, approximate=True)
+
+    def iter_events(self, block=5000):
+        """Нескінченно віддає нові події задач (для фронтенду бота)"""
+        last_id = "$"
+        while True:
+            response = self.redis.xread({self.events_stream: last_id}, block=block)
+            for _, entries in response or []:
+                for last_id, fields in entries:
+                    yield fields
+
+
+class InMemoryJobBus(JobBusBase):
+    """
+    Заміна RedisJobBus в межах одного процесу (для тестів і запуску без Redis) з тією самою
+    семантикою: пріоритетні смуги, таймаут видимості, обмеження видач, dead-letter і події.
+    """
+
+    def __init__(self, **kwargs):
+        self.condition = threading.Condition()
+        self.queues = {priority: deque() for priority in PRIORITIES}  # {priority: deque((job_id, fields))}
+        self.entries = {}  # {job_id: fields} для виданих, але не підтверджених задач
+        self.leases = {}  # {job_id: (deadline, deliveries)}
+        self.dead = deque(maxlen=DEAD_LETTER_MAXLEN)
+        self.events = deque(maxlen=EVENTS_MAXLEN)  # (порядковий номер, подія)
+        self.event_sequence = 0
+        self.ids = itertools.count(1)
+        super().__init__(**kwargs)
+
+    def enqueue(self, kind, user_id, payload, priority=PRIORITY_SINGLE):
+        with self.condition:
+            job_id = f"{priority}/{next(self.ids)}"
+            self.queues[priority].append((job_id, _job_fields(kind, user_id, payload, priority)))
+            self.condition.notify()
+            return job_id
+
+    def position(self, job_id):
+        priority = int(job_id.split("/", 1)[0])
+        with self.condition:
+            ahead = sum(len(self.queues[p]) for p in PRIORITIES if p < priority)
+            for queued_id, _ in self.queues[priority]:
+                if queued_id == job_id:
+                    break
+                ahead += 1
+            return ahead
+
+    def pending_count(self):
+        with self.condition:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def _reclaim_expired(self):
+        now = time.monotonic()
+        with self.condition:
+            for job_id, (deadline, deliveries) in list(self.leases.items()):
+                if deadline > now:
+                    continue
+                job = _job_from_fields(job_id, self.entries[job_id], deliveries + 1)
+                if job.attempts > self.max_deliveries:
+                    self._dead_letter(job, "too many deliveries")
+                    self.publish_event(job, EVENT_DEAD, "too many deliveries")
+                    continue
+                self.leases[job_id] = (now + self.visibility_timeout, job.attempts)
+                return job
+        return None
+
+    def _read_next(self, deadline):
+        with self.condition:
+            while True:
+                for priority in PRIORITIES:
+                    if self.queues[priority]:
+                        job_id, fields = self.queues[priority].popleft()
+                        self.entries[job_id] = fields
+                        deliveries = int(fields["attempts"]) + 1
+                        self.leases[job_id] = (time.monotonic() + self.visibility_timeout, deliveries)
+                        return _job_from_fields(job_id, fields, deliveries)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                # Прокидаємось вчасно, щоб забрати задачі з простроченою видимістю
+                self.condition.wait(self.visibility_timeout if remaining is None
+                                    else min(remaining, self.visibility_timeout))
+                if self.leases and min(lease[0] for lease in self.leases.values()) <= time.monotonic():
+                    return None
+
+    def _ack(self, job):
+        with self.condition:
+            self.leases.pop(job.id, None)
+            self.entries.pop(job.id, None)
+
+    def _extend(self, job_ids):
+        now = time.monotonic()
+        with self.condition:
+            for job_id in job_ids:
+                if job_id in self.leases:
+                    self.leases[job_id] = (now + self.visibility_timeout, self.leases[job_id][1])
+
+    def _dead_letter(self, job, reason):
+        with self.condition:
+            self.dead.append((job, reason))
+        self._ack(job)
+
+    def publish_event(self, job, status, detail=None):
+        with self.condition:
+            self.event_sequence += 1
+            self.events.append((self.event_sequence, self.event_payload(job, status, detail)))
+            self.condition.notify_all()
+
+    def iter_events(self, block=5000):
+        """Як і XREAD з "$": віддає події, опубліковані після початку читання"""
+        with self.condition:
+            last_sequence = self.event_sequence
+        while True:
+            with self.condition:
+                # Старі події випадають з обмеженого deque, тому відлік ведемо за номером, а не за індексом
+                new_events = [(sequence, event) for sequence, event in self.events if sequence > last_sequence]
+                if not new_events:
+                    self.condition.wait(block / 1000)
+                    continue
+            last_sequence = new_events[-1][0]
+            for _, event in new_events:
+                yield event
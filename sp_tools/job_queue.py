@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Типи задач
+JOB_TRACK_DOWNLOAD = "track_download"
+JOB_PLAYLIST_DOWNLOAD = "playlist_download"
+JOB_PLAYLIST_ZIP = "playlist_zip"
+JOB_EFFECT_RENDER = "effect_render"
+JOB_VIDEO_DOWNLOAD = "video_download"
+
+# Пріоритетні смуги: чим менше число, тим раніше задача потрапить до виконавця
+PRIORITY_ADMIN = 0
+PRIORITY_SINGLE = 1
+PRIORITY_PLAYLIST = 2
+
+JOB_QUEUE_PATH = "cache/jobs.sqlite3"
+# Кількість потоків, що виконують задачі з черги
+JOB_WORKERS = 3
+# Скільки задач одного користувача можуть виконуватися одночасно
+MAX_RUNNING_PER_USER = 1
+# Скільки зберігати виконані та невдалі задачі (разом з payload) для розбору, і як часто їх чистити
+FINISHED_JOB_RETENTION = 7 * 24 * 3600
+PRUNE_INTERVAL = 3600
+# Задача, яку вже стільки разів брали в роботу і бот щоразу зупинявся, не повертається в чергу
+MAX_JOB_ATTEMPTS = 3
+
+
+class Job:
+    """Задача, отримана з черги"""
+
+    __slots__ = ("id", "kind", "user_id", "priority", "payload", "attempts")
+
+    def __init__(self, job_id, kind, user_id, priority, payload, attempts=0):
+        self.id = job_id
+        self.kind = kind
+        self.user_id = user_id
+        self.priority = priority
+        self.payload = payload
+        self.attempts = attempts
+
+
+class JobQueue:
+    """
+    Персистентна черга задач на SQLite з пріоритетними смугами.
+    Всередині смуги задачі видаються по черзі різним користувачам (round-robin),
+    тож великий плейлист одного користувача не блокує інших.
+    """
+
+    def __init__(self, db_path=JOB_QUEUE_PATH, max_running_per_user=MAX_RUNNING_PER_USER):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.max_running_per_user = max_running_per_user
+        self.condition = threading.Condition()
+        self.last_served = {}  # {user_id: час останньої виданої задачі}
+        self.running = {}  # {user_id: кількість задач у роботі}
+        self.pruned_at = 0
+
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                priority INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (status, priority, id)"
+        )
+        # Задачі, що виконувалися під час зупинки бота, повертаємо в чергу, якщо спроби не вичерпано:
+        # інакше задача, яка валить процес, перезапускала б його безкінечно
+        abandoned = self.connection.execute(
+            "UPDATE jobs SET status = 'failed', error = 'too many attempts', finished_at = ? "
+            "WHERE status = 'running' AND attempts >= ?",
+            (time.time(), MAX_JOB_ATTEMPTS)
+        ).rowcount
+        restored = self.connection.execute(
+            "UPDATE jobs SET status = 'queued' WHERE status = 'running'"
+        ).rowcount
+        self.connection.commit()
+        if restored:
+            logger.info(f"Restored {restored} interrupted jobs")
+        if abandoned:
+            logger.error(f"Failed {abandoned} interrupted jobs after {MAX_JOB_ATTEMPTS} attempts")
+        self._prune_finished()
+
+    def _prune_finished(self):
+        """Видаляє завершені задачі, старші за FINISHED_JOB_RETENTION, щоб файл бази не ріс безмежно"""
+        self.pruned_at = time.monotonic()
+        deleted = self.connection.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - FINISHED_JOB_RETENTION,)
+        ).rowcount
+        self.connection.commit()
+        if deleted:
+            logger.info(f"Pruned {deleted} finished jobs")
+
+    def enqueue(self, kind, user_id, payload, priority=PRIORITY_SINGLE):
+        """Додає задачу в чергу і повертає її ID"""
+        with self.condition:
+            cursor = self.connection.execute(
+                "INSERT INTO jobs (kind, user_id, priority, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, user_id, priority, json.dumps(payload, ensure_ascii=False), time.time())
+            )
+            self.connection.commit()
+            self.condition.notify()
+            return cursor.lastrowid
+
+    def position(self, job_id):
+        """Повертає кількість задач, які будуть виконані раніше за вказану"""
+        with self.condition:
+            row = self.connection.execute(
+                "SELECT priority FROM jobs WHERE id = ? AND status = 'queued'", (job_id,)
+            ).fetchone()
+            if not row:
+                return 0
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority < ? OR (priority = ? AND id < ?))",
+                (row[0], row[0], job_id)
+            ).fetchone()[0]
+
+    def pending_count(self):
+        with self.condition:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+            ).fetchone()[0]
+
+    def _select_next(self):
+        """Вибирає наступну задачу: найвища смуга, потім користувач, якого обслуговували найдавніше"""
+        # Payload читається лише для вибраної задачі: у плейлистів він великий
+        rows = self.connection.execute(
+            "SELECT id, user_id, priority FROM jobs WHERE status = 'queued' ORDER BY priority, id"
+        ).fetchall()
+
+        best = None
+        for row in rows:
+            job_id, user_id, priority = row
+            if self.running.get(user_id, 0) >= self.max_running_per_user:
+                continue
+            if best is not None and priority > best[2]:
+                break
+            # Перша задача кожного користувача в смузі; перевага тому, хто довше чекав
+            if best is None or self.last_served.get(user_id, 0) < self.last_served.get(best[1], 0):
+                best = row
+        return best
+
+    def claim(self, timeout=None):
+        """Блокує потік до появи задачі і позначає її як виконувану"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            if time.monotonic() - self.pruned_at > PRUNE_INTERVAL:
+                self._prune_finished()
+            while True:
+                row = self._select_next()
+                if row:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+            job_id, user_id, priority = row
+            kind, payload, attempts = self.connection.execute(
+                "SELECT kind, payload, attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            self.connection.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (time.time(), job_id)
+            )
+            self.connection.commit()
+            self.last_served[user_id] = time.monotonic()
+            self.running[user_id] = self.running.get(user_id, 0) + 1
+            return Job(job_id, kind, user_id, priority, json.loads(payload), attempts + 1)
+
+    def _finish(self, job, status, error=None):
+        with self.condition:
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time(), job.id)
+            )
+            self.connection.commit()
+            self.running[job.user_id] = max(self.running.get(job.user_id, 1) - 1, 0)
+            # Звільнився слот користувача — інший виконавець може взяти його наступну задачу
+            self.condition.notify_all()
+
+    def complete(self, job):
+        self._finish(job, "done")
+
+    def fail(self, job, error):
+        self._finish(job, "failed", str(error))
+
+
+class JobWorkerPool:
+    """Потоки, які забирають задачі з черги та передають їх обробникам за типом"""
+
+    def __init__(self, queue, handlers, workers=JOB_WORKERS):
+        self.queue = queue
+        self.handlers = handlers  # {kind: функція(job)}
+        self.workers = workers
+        self.threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"Started {self.workers} job workers")
+
+    def _worker_loop(self):
+        while True:
+            job = self.queue.claim()
+            handler = self.handlers.get(job.kind)
+            if handler is None:
+                logger.error(f"No handler for job kind {job.kind}")
+                self.queue.fail(job, "unknown job kind")
+                continue
+
+            try:
+                handler(job)
+            except Exception as e:
+                logger.exception(f"Job {job.id} ({job.kind}) failed: {str(e)}")
+                self.queue.fail(job, e)
+            else:
+                self.queue.complete(job)
@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import mutagen
+from mutagen.id3 import ID3, TXXX, COMM, ID3NoHeaderError
+from mutagen.mp4 import MP4, MP4FreeForm
+
+from sp_tools.transcode import FFMPEG_BINARY, run_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+LOUDNESS_STORE_PATH = "cache/loudness.sqlite3"
+
+# Режими нормалізації:
+#   "render" — кешоване підсилення застосовується під час кодування (volume у фільтрі ffmpeg)
+#   "tag"    — аудіо не змінюється, у файл записуються теги ReplayGain/iTunNORM
+LOUDNESS_MODE_RENDER = "render"
+LOUDNESS_MODE_TAG = "tag"
+
+# Цільова гучність для режиму render (LUFS) та межа справжнього піку (dBTP)
+TARGET_LOUDNESS = -14.0
+MAX_TRUE_PEAK = -1.0
+# Опорний рівень ReplayGain 2.0
+REPLAYGAIN_REFERENCE = -18.0
+
+
+class LoudnessMeasurement:
+    """Результат вимірювання гучності за EBU R128"""
+
+    __slots__ = ("integrated", "true_peak", "lra", "threshold")
+
+    def __init__(self, integrated, true_peak, lra, threshold):
+        self.integrated = integrated
+        self.true_peak = true_peak
+        self.lra = lra
+        self.threshold = threshold
+
+    def render_gain(self, target=TARGET_LOUDNESS, max_true_peak=MAX_TRUE_PEAK):
+        """Підсилення (дБ) до цільової гучності, обмежене так, щоб пік не перевищив max_true_peak"""
+        gain = target - self.integrated
+        return round(min(gain, max_true_peak - self.true_peak), 2)
+
+    def replaygain(self):
+        return round(REPLAYGAIN_REFERENCE - self.integrated, 2)
+
+    def peak_linear(self):
+        return round(10 ** (self.true_peak / 20), 6)
+
+
+def measure_loudness(source_path):
+    """
+    Вимірює гучність файлу фільтром loudnorm без збереження результату.
+    ffmpeg читає файл потоково, тож весь трек у пам'ять не завантажується.
+    """
+    command = [
+        FFMPEG_BINARY, "-hide_banner", "-nostats", "-i", source_path, "-vn",
+        "-af", f"loudnorm=I={TARGET_LOUDNESS}:TP={MAX_TRUE_PEAK}:LRA=11:print_format=json",
+        "-f", "null", "-"
+    ]
+    result = run_ffmpeg(command)
+    output = result.stderr.decode("utf-8", errors="replace")
+    if result.returncode != 0:
+        raise RuntimeError(f"Помилка вимірювання гучності: {output[-300:]}")
+
+    # loudnorm друкує JSON з результатами в кінці виводу
+    blocks = re.findall(r"\{[^{}]*\"input_i\"[^{}]*\}", output)
+    if not blocks:
+        raise RuntimeError("ffmpeg не повернув результат вимірювання гучності")
+    data = json.loads(blocks[-1])
+
+    def as_float(value, default):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return default
+        # Для тиші ffmpeg повертає -inf
+        return value if value > -99 else default
+
+    return LoudnessMeasurement(
+        integrated=as_float(data.get("input_i"), -70.0),
+        true_peak=as_float(data.get("input_tp"), -70.0),
+        lra=as_float(data.get("input_lra"), 0.0),
+        threshold=as_float(data.get("input_thresh"), -70.0),
+    )
+
+
+class LoudnessStore:
+    """Кеш результатів вимірювання гучності за ID джерела (videoId YouTube)"""
+
+    def __init__(self, db_path=LOUDNESS_STORE_PATH):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS loudness (
+                source_id TEXT PRIMARY KEY,
+                integrated REAL NOT NULL,
+                true_peak REAL NOT NULL,
+                lra REAL NOT NULL,
+                threshold REAL NOT NULL,
+                measured_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+
+    def get(self, source_id):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT integrated, true_peak, lra, threshold FROM loudness WHERE source_id = ?", (source_id,)
+            ).fetchone()
+        return LoudnessMeasurement(*row) if row else None
+
+    def put(self, source_id, measurement):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO loudness VALUES (?, ?, ?, ?, ?, ?)",
+                (source_id, measurement.integrated, measurement.true_peak, measurement.lra,
+                 measurement.threshold, time.time())
+            )
+            self.connection.commit()
+
+    def get_or_measure(self, source_id, source_path):
+        """Повертає кешоване вимірювання або вимірює файл один раз"""
+        measurement = self.get(source_id)
+        if measurement:
+            return measurement
+
+        measurement = measure_loudness(source_path)
+        self.put(source_id, measurement)
+        logger.info(f"Measured loudness for {source_id}: {measurement.integrated} LUFS, "
+                    f"{measurement.true_peak} dBTP")
+        return measurement
+
+
+def build_itunnorm(measurement):
+    """Формує значення iTunNORM (Sound Check) з підсилення ReplayGain"""
+    gain = measurement.replaygain()
+    value_1000 = min(int(round(1000 * 10 ** (-gain / 10))), 65534)
+    value_2500 = min(int(round(2500 * 10 ** (-gain / 10))), 65534)
+    peak = min(int(measurement.peak_linear() * 32768), 0x7FFF)
+    values = [value_1000, value_1000, value_2500, value_2500, 0, 0, peak, peak, 0, 0]
+    return "".join(f" {value:08X}" for value in values)
+
+
+def write_loudness_tags(file_path, audio_format, measurement):
+    """Записує теги ReplayGain (і iTunNORM для MP3/M4A) без перекодування аудіо"""
+    track_gain = f"{measurement.replaygain():+.2f} dB"
+    track_peak = f"{measurement.peak_linear():.6f}"
+    itunnorm = build_itunnorm(measurement)
+
+    if audio_format == "mp3":
+        try:
+            tags = ID3(file_path)
+        except ID3NoHeaderError:
+            tags = ID3()
+        tags.add(TXXX(encoding=3, desc="REPLAYGAIN_TRACK_GAIN", text=[track_gain]))
+        tags.add(TXXX(encoding=3, desc="REPLAYGAIN_TRACK_PEAK", text=[track_peak]))
+        tags.add(COMM(encoding=3, lang="eng", desc="iTunNORM", text=[itunnorm]))
+        tags.save(file_path)
+    elif audio_format == "m4a":
+        audio = MP4(file_path)
+        audio["----:com.apple.iTunes:replaygain_track_gain"] = [MP4FreeForm(track_gain.encode("utf-8"))]
+        audio["----:com.apple.iTunes:replaygain_track_peak"] = [MP4FreeForm(track_peak.encode("utf-8"))]
+        audio["----:com.apple.iTunes:iTunNORM"] = [MP4FreeForm(itunnorm.encode("utf-8"))]
+        audio.save()
+    elif audio_format == "flac":
+        audio = mutagen.File(file_path)
+        audio["REPLAYGAIN_TRACK_GAIN"] = track_gain
+        audio["REPLAYGAIN_TRACK_PEAK"] = track_peak
+        audio.save()
+    else:
+        # WAV плеєри зазвичай не читають ReplayGain — тег не записуємо
+        logger.debug(f"Loudness tags are not supported for {audio_format}")
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from sp_tools.tagging import parse_synced_lyrics
+
+logger = logging.getLogger(__name__)
+
+LYRICS_WORKERS = 12
+# Синхронізований текст чекаємо до SYNCED_DEADLINE, після цього підходить і звичайний;
+# після TOTAL_DEADLINE повертаємо те, що є
+SYNCED_DEADLINE = 6
+TOTAL_DEADLINE = 10
+# Параметри автоматичного пониження повільних чи марних провайдерів
+STATS_SMOOTHING = 0.2
+MIN_SAMPLES = 10
+MIN_SUCCESS_RATE = 0.15
+PROBE_INTERVAL = 20
+
+lyrics_executor = ThreadPoolExecutor(max_workers=LYRICS_WORKERS, thread_name_prefix="lyrics")
+
+
+class ProviderStats:
+    """Згладжені (EWMA) затримка і частка успішних відповідей провайдера"""
+
+    __slots__ = ("attempts", "errors", "latency", "success_rate")
+
+    def __init__(self):
+        self.attempts = 0
+        self.errors = 0
+        self.latency = 0.0
+        self.success_rate = 1.0
+
+    def record(self, latency, found, failed):
+        self.attempts += 1
+        if failed:
+            self.errors += 1
+        if self.attempts == 1:
+            self.latency = latency
+            self.success_rate = 1.0 if found else 0.0
+        else:
+            self.latency += STATS_SMOOTHING * (latency - self.latency)
+            self.success_rate += STATS_SMOOTHING * ((1.0 if found else 0.0) - self.success_rate)
+
+    def is_demoted(self):
+        if self.attempts < MIN_SAMPLES:
+            return False
+        return self.success_rate < MIN_SUCCESS_RATE or self.latency > TOTAL_DEADLINE
+
+    def as_dict(self):
+        return {
+            "attempts": self.attempts,
+            "errors": self.errors,
+            "latency": round(self.latency, 3),
+            "success_rate": round(self.success_rate, 3),
+            "demoted": self.is_demoted(),
+        }
+
+
+class LyricsResolution:
+    """Результат пошуку: текст (або None) і скільки провайдерів відповіли без помилки"""
+
+    __slots__ = ("lyrics", "synced", "answered")
+
+    def __init__(self, lyrics=None, synced=False, answered=0):
+        self.lyrics = lyrics
+        self.synced = synced
+        self.answered = answered
+
+
+class LyricsResolver:
+    """
+    Опитує всіх провайдерів одночасно (кожен окремим викликом search_func з providers=[name]).
+    Перший синхронізований текст повертається одразу, решта запитів скасовується; звичайний
+    текст приймається лише після SYNCED_DEADLINE. Понижені провайдери опитуються тільки
+    кожного PROBE_INTERVAL-го разу, щоб помітити, коли вони знову запрацюють.
+    """
+
+    def __init__(self, search_func, providers, executor=lyrics_executor):
+        self.search_func = search_func
+        self.providers = list(providers)
+        self.executor = executor
+        self.stats = {provider: ProviderStats() for provider in self.providers}
+        self.lock = threading.Lock()
+        self.resolutions = 0
+
+    def _select_providers(self):
+        with self.lock:
+            self.resolutions += 1
+            probe = self.resolutions % PROBE_INTERVAL == 0
+            selected = [provider for provider in self.providers
+                        if probe or not self.stats[provider].is_demoted()]
+            # Якщо всі понижені — опитуємо всіх, інакше тексту не буде взагалі
+            selected = selected or list(self.providers)
+            # Швидші провайдери першими отримують потоки з пулу
+            return sorted(selected, key=lambda provider: self.stats[provider].latency)
+
+    def _query(self, provider, search_term):
+        started = time.monotonic()
+        found = failed = False
+        try:
+            lyrics = self.search_func(search_term, enhanced=True, providers=[provider])
+            found = bool(lyrics)
+            return lyrics
+        except Exception:
+            failed = True
+            raise
+        finally:
+            with self.lock:
+                self.stats[provider].record(time.monotonic() - started, found, failed)
+
+    def resolve(self, search_term, synced_deadline=SYNCED_DEADLINE, total_deadline=TOTAL_DEADLINE):
+        started = time.monotonic()
+        futures = {self.executor.submit(self._query, provider, search_term): provider
+                   for provider in self._select_providers()}
+        pending = set(futures)
+        plain = None
+        answered = 0
+
+        try:
+            while pending:
+                elapsed = time.monotonic() - started
+                if elapsed >= total_deadline or (plain and elapsed >= synced_deadline):
+                    break
+                timeout = (synced_deadline if plain else total_deadline) - elapsed
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    provider = futures[future]
+                    try:
+                        lyrics = future.result()
+                    except Exception as e:
+                        logger.warning(f"Lyrics provider {provider} failed for {search_term}: {str(e)}")
+                        continue
+                    answered += 1
+                    if not lyrics:
+                        continue
+                    if parse_synced_lyrics(lyrics):
+                        logger.info(f"Synced lyrics for {search_term} from {provider} "
+                                    f"in {time.monotonic() - started:.2f}s")
+                        return LyricsResolution(lyrics, True, answered)
+                    plain = plain or lyrics
+        finally:
+            # Ще не розпочаті запити скасовуються; ті, що вже виконуються, доробляють у фоні
+            # і лише оновлюють статистику провайдера
+            for future in pending:
+                future.cancel()
+
+        return LyricsResolution(plain, False, answered)
+
+    def provider_stats(self):
+        with self.lock:
+            return {provider: stats.as_dict() for provider, stats in self.stats.items()}
@@ -0,0 +1,129 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+LYRICS_STORE_PATH = "cache/lyrics.sqlite3"
+# Знайдені тексти майже не змінюються, а відсутні можуть з'явитись у провайдерів пізніше
+FOUND_TTL = 90 * 24 * 3600
+MISS_TTL = 3 * 24 * 3600
+
+# "(feat. ...)", "[Remastered 2011]", "- Radio Edit" тощо не впливають на текст пісні
+TITLE_NOISE_PATTERN = re.compile(r"\s*[(\[][^)\]]*[)\]]|\s+-\s+.*$")
+FEAT_PATTERN = re.compile(r"\s+(feat\.?|ft\.?|featuring)\s+.*$", re.IGNORECASE)
+NON_WORD_PATTERN = re.compile(r"[^\w]+")
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return " ".join(NON_WORD_PATTERN.sub(" ", text).split())
+
+
+def make_lyrics_key(artist, title):
+    """Ключ за нормалізованими виконавцем (лише перший) і назвою без приміток у дужках"""
+    artist = FEAT_PATTERN.sub("", (artist or "").split(",")[0])
+    title = FEAT_PATTERN.sub("", TITLE_NOISE_PATTERN.sub("", title or "")) or title
+    return f"name:{_normalize(artist)}|{_normalize(title)}"
+
+
+class LyricsRecord:
+    """Збережений результат пошуку. Обидва поля None — тексту немає в жодного провайдера"""
+
+    __slots__ = ("synced", "plain")
+
+    def __init__(self, synced=None, plain=None):
+        self.synced = synced
+        self.plain = plain
+
+    @property
+    def found(self):
+        return bool(self.synced or self.plain)
+
+    def best(self):
+        """Синхронізований текст має перевагу над звичайним"""
+        return self.synced or self.plain
+
+
+class LyricsStore:
+    """
+    Постійний кеш текстів пісень за нормалізованими виконавцем/назвою та ISRC.
+    Невдалі пошуки теж зберігаються (з коротшим терміном), щоб треки без тексту
+    не проходили повний обхід провайдерів при кожному завантаженні.
+    """
+
+    def __init__(self, db_path=LYRICS_STORE_PATH):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS lyrics (
+                key TEXT PRIMARY KEY,
+                synced TEXT,
+                plain TEXT,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _keys(artist, title, isrc=None):
+        keys = [f"isrc:{isrc.upper()}"] if isrc else []
+        keys.append(make_lyrics_key(artist, title))
+        return keys
+
+    def get(self, artist, title, isrc=None):
+        """Повертає LyricsRecord або None, якщо трек ще не шукали (чи запис прострочений)"""
+        now = time.time()
+        with self.lock:
+            for key in self._keys(artist, title, isrc):
+                row = self.connection.execute(
+                    "SELECT synced, plain FROM lyrics WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row:
+                    record = LyricsRecord(*row)
+                    if record.found:
+                        self.hits += 1
+                    else:
+                        self.negative_hits += 1
+                    return record
+            self.misses += 1
+        return None
+
+    def put(self, artist, title, synced=None, plain=None, isrc=None):
+        record = LyricsRecord(synced, plain)
+        expires_at = time.time() + (FOUND_TTL if record.found else MISS_TTL)
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO lyrics VALUES (?, ?, ?, ?)",
+                [(key, synced, plain, expires_at) for key in self._keys(artist, title, isrc)]
+            )
+            self.connection.commit()
+        return record
+
+    def purge_expired(self):
+        with self.lock:
+            deleted = self.connection.execute("DELETE FROM lyrics WHERE expires_at <= ?", (time.time(),)).rowcount
+            self.connection.commit()
+        return deleted
+
+    def stats(self):
+        with self.lock:
+            entries, negative_entries = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(synced IS NULL AND plain IS NULL), 0) FROM lyrics"
+            ).fetchone()
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "entries": entries,
+                "negative_entries": negative_entries,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            }
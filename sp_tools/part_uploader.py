@@ -0,0 +1,42 @@
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PartUploader:
+    """
+    Надсилає частини архіву у фоновому потоці, поки наступні треки ще завантажуються.
+    Частини надсилаються по черзі в порядку номерів; помилка однієї частини
+    не зупиняє надсилання решти. upload_func(number, path) повертає надіслане повідомлення.
+    """
+
+    def __init__(self, upload_func):
+        self.upload_func = upload_func
+        self.parts = queue.Queue()
+        self.sent = {}  # {номер частини: повідомлення}
+        self.failed = {}  # {номер частини: виняток}
+        self.thread = threading.Thread(target=self._run, name="part-uploader", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            part = self.parts.get()
+            if part is None:
+                return
+            number, path = part
+            try:
+                self.sent[number] = self.upload_func(number, path)
+            except Exception as e:
+                logger.exception(f"Failed to upload part {number} ({path}): {str(e)}")
+                self.failed[number] = e
+
+    def submit(self, number, path):
+        self.parts.put((number, path))
+
+    def finish(self):
+        """Чекає, поки всі додані частини будуть надіслані; повертає (надіслані, невдалі)"""
+        self.parts.put(None)
+        self.thread.join()
+        return self.sent, self.failed
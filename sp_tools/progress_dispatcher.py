@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+
+import telebot
+
+logger = logging.getLogger(__name__)
+
+# Мінімальний інтервал між редагуваннями одного повідомлення (секунди)
+PROGRESS_EDIT_INTERVAL = 3.0
+# Через скільки секунд забувати повідомлення, які більше не оновлюються
+SENT_STATE_TTL = 15 * 60
+
+
+class ProgressDispatcher:
+    """
+    Фоновий диспетчер редагувань повідомлень з прогресом. Для кожного повідомлення
+    зберігається лише останній текст: проміжні стани, що не встигли відправитись,
+    замінюються новими, тож повідомлення редагується не частіше ніж раз на interval.
+    Кінцевий стан (final=True) відправляється без очікування і завжди доходить;
+    пізніші проміжні оновлення того самого повідомлення після нього ігноруються.
+    """
+
+    def __init__(self, bot, interval=PROGRESS_EDIT_INTERVAL):
+        self.bot = bot
+        self.interval = interval
+        self.pending = {}  # {(chat_id, message_id): (текст, final)}
+        self.sent = {}  # {(chat_id, message_id): (час, текст, final)}
+        self.deferred = {}  # {(chat_id, message_id): час, раніше якого чат не можна редагувати}
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="progress-dispatcher", daemon=True)
+        self.thread.start()
+
+    def update(self, chat_id, message_id, text, final=False):
+        key = (chat_id, message_id)
+        with self.condition:
+            sent = self.sent.get(key)
+            if sent and sent[2]:
+                return  # Повідомлення вже в кінцевому стані
+            pending = self.pending.get(key)
+            if pending and pending[1] and not final:
+                return
+            self.pending[key] = (text, final)
+            self.condition.notify()
+
+    def _next_due(self):
+        """Повертає (ключі, які вже можна надіслати, скільки чекати до наступного)"""
+        now = time.monotonic()
+        due = []
+        wait = None
+        for key, (_, final) in self.pending.items():
+            sent = self.sent.get(key)
+            ready_at = now if final or not sent else sent[0] + self.interval
+            ready_at = max(ready_at, self.deferred.get(key, 0))
+            if ready_at <= now:
+                due.append(key)
+            else:
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+        return due, wait
+
+    def _forget_stale(self):
+        deadline = time.monotonic() - SENT_STATE_TTL
+        for key in [key for key, (sent_at, _, _) in self.sent.items() if sent_at < deadline]:
+            del self.sent[key]
+        for key in [key for key in self.deferred if key not in self.pending]:
+            del self.deferred[key]
+
+    def _edit(self, chat_id, message_id, text):
+        """Редагує повідомлення; повертає, через скільки секунд повторити (0 — відправлено)"""
+        try_call = getattr(self.bot, "try_call", None)
+        if try_call is None:
+            self.bot.edit_message_text(text, chat_id, message_id)
+            return 0.0
+        # Через RateLimitedBot редагування не чекає на ліміт чату, щоб не зупиняти інші чати
+        return try_call("edit_message_text", chat_id, text, chat_id, message_id)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                due, wait = self._next_due()
+                while not due:
+                    self.condition.wait(wait)
+                    due, wait = self._next_due()
+                updates = [(key, *self.pending.pop(key)) for key in due]
+                self._forget_stale()
+
+            for (chat_id, message_id), text, final in updates:
+                with self.condition:
+                    sent = self.sent.get((chat_id, message_id))
+                    if sent and sent[1] == text:
+                        self.sent[(chat_id, message_id)] = (sent[0], text, final)
+                        continue
+                try:
+                    delay = self._edit(chat_id, message_id, text)
+                except telebot.apihelper.ApiTelegramException as e:
+                    # "message is not modified" та видалені повідомлення не є помилкою прогресу
+                    logger.debug(f"Progress edit for {chat_id}/{message_id} failed: {str(e)}")
+                    delay = 0
+                except Exception as e:
+                    logger.warning(f"Progress edit for {chat_id}/{message_id} failed: {str(e)}")
+                    delay = 0
+                with self.condition:
+                    key = (chat_id, message_id)
+                    if delay > 0:
+                        # Чат обмежений: стан повертається в чергу, якщо новішого ще немає
+                        if final or key not in self.pending:
+                            self.pending[key] = (text, final)
+                        self.deferred[key] = time.monotonic() + delay
+                        continue
+                    self.deferred.pop(key, None)
+                    self.sent[key] = (time.monotonic(), text, final)
+
+
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+
+def get_progress_dispatcher(bot):
+    """Один диспетчер на бота, спільний для всіх повідомлень з прогресом"""
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(id(bot))
+        if dispatcher is None:
+            dispatcher = _dispatchers[id(bot)] = ProgressDispatcher(bot)
+        return dispatcher
@@ -0,0 +1,253 @@
+import itertools
+import logging
+import threading
+import time
+
+import telebot
+
+logger = logging.getLogger(__name__)
+
+# Ліміти Telegram: ~30 повідомлень на секунду загалом і ~1 на секунду в одному чаті
+GLOBAL_RATE = 30
+GLOBAL_BURST = 30
+CHAT_RATE = 1
+CHAT_BURST = 3
+# Скільки разів повторювати запит після 429 Too Many Requests
+MAX_FLOOD_RETRIES = 3
+# Відра чатів, до яких не зверталися стільки секунд, видаляються (повне відро — те саме, що нове)
+IDLE_BUCKET_TTL = 60
+
+# Результати для користувача (файли, повідомлення, кнопки) мають перевагу над редагуванням прогресу
+PRIORITY_RESULT = 0
+PRIORITY_PROGRESS = 1
+
+RESULT_METHODS = {
+    "send_message", "send_audio", "send_document", "send_video", "send_photo", "send_voice",
+    "send_media_group", "copy_message", "forward_message", "edit_message_reply_markup", "edit_message_caption",
+    "reply_to",
+}
+PROGRESS_METHODS = {"edit_message_text"}
+# Позиція chat_id серед позиційних аргументів, якщо вона не перша
+CHAT_ID_POSITION = {"edit_message_text": 1, "edit_message_caption": 1}
+
+
+class TokenBucket:
+    """Відро токенів: rate токенів на секунду, не більше capacity одночасно"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Скільки секунд чекати до наступного токена (0 — можна зараз)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class OutboundLimiter:
+    """
+    Спільний планувальник вихідних запитів до Telegram. Запит отримує дозвіл, коли є
+    токени в глобальному відрі і у відрі свого чату; серед готових першим іде запит
+    з вищим пріоритетом. Після 429 чат призупиняється на retry_after секунд.
+    """
+
+    def __init__(self, global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST, chat_rate=CHAT_RATE,
+                 chat_burst=CHAT_BURST):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = {}
+        self.paused_until = {}  # {chat_id: час, до якого чат призупинено після 429}
+        self.waiting = {}  # {ticket: chat_id}, ticket = (пріоритет, порядковий номер)
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.evicted_at = time.monotonic()
+        # Метрики
+        self.granted = 0
+        self.throttled = 0
+        self.total_delay = 0.0
+        self.max_delay = 0.0
+        self.flood_errors = 0
+
+    def _chat_delay(self, chat_id, now):
+        if chat_id is None:
+            return 0.0
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return max(bucket.delay(now), self.paused_until.get(chat_id, 0) - now)
+
+    def _evict_idle(self, now):
+        """Прибирає відра і паузи чатів, які давно не надсилали запитів"""
+        if now - self.evicted_at < IDLE_BUCKET_TTL:
+            return
+        self.evicted_at = now
+        waiting_chats = set(self.waiting.values())
+        for chat_id in [chat_id for chat_id, bucket in self.chat_buckets.items()
+                        if now - bucket.updated > IDLE_BUCKET_TTL and chat_id not in waiting_chats]:
+            del self.chat_buckets[chat_id]
+        for chat_id in [chat_id for chat_id, until in self.paused_until.items() if until < now]:
+            del self.paused_until[chat_id]
+
+    def try_acquire(self, chat_id, priority=PRIORITY_PROGRESS):
+        """
+        Неблокуючий варіант acquire для фонових потоків: бере дозвіл і повертає 0 або,
+        якщо чат чи загальний ліміт зайняті, повертає, через скільки секунд спробувати знову
+        """
+        with self.condition:
+            now = time.monotonic()
+            self._evict_idle(now)
+            delay = max(self._chat_delay(chat_id, now), self.global_bucket.delay(now))
+            # Запити, які вже чекають в acquire і готові до відправлення, мають перевагу
+            if delay <= 0 and any(self._chat_delay(waiting_chat, now) <= 0 for waiting_chat in self.waiting.values()):
+                delay = 1 / self.global_bucket.rate
+            if delay > 0:
+                self.throttled += 1
+                return delay
+
+            self.global_bucket.take(now)
+            if chat_id is not None:
+                self.chat_buckets[chat_id].take(now)
+            self.granted += 1
+            return 0.0
+
+    def acquire(self, chat_id, priority=PRIORITY_RESULT):
+        """Блокує потік, доки запит не можна відправити; повертає час очікування"""
+        started = time.monotonic()
+        ticket = (priority, next(self.sequence))
+        with self.condition:
+            self._evict_idle(time.monotonic())
+            self.waiting[ticket] = chat_id
+            try:
+                while True:
+                    now = time.monotonic()
+                    chat_delay = self._chat_delay(chat_id, now)
+                    # Дозвіл отримує найпріоритетніший запит серед тих, чий чат уже готовий
+                    first_ready = next((waiting_ticket for waiting_ticket in sorted(self.waiting)
+                                        if self._chat_delay(self.waiting[waiting_ticket], now) <= 0), None)
+                    global_delay = self.global_bucket.delay(now)
+
+                    if first_ready == ticket and global_delay <= 0:
+                        self.global_bucket.take(now)
+                        if chat_id is not None:
+                            self.chat_buckets[chat_id].take(now)
+                        break
+
+                    timeout = chat_delay if chat_delay > 0 else max(global_delay, 0.01)
+                    self.condition.wait(timeout)
+            finally:
+                del self.waiting[ticket]
+                self.condition.notify_all()
+
+            waited = time.monotonic() - started
+            self.granted += 1
+            if waited > 0.01:
+                self.throttled += 1
+                self.total_delay += waited
+                self.max_delay = max(self.max_delay, waited)
+            return waited
+
+    def pause_chat(self, chat_id, seconds):
+        with self.condition:
+            self.flood_errors += 1
+            self.paused_until[chat_id] = max(self.paused_until.get(chat_id, 0), time.monotonic() + seconds)
+
+    def stats(self):
+        with self.condition:
+            return {
+                "queue_depth": len(self.waiting),
+                "tracked_chats": len(self.chat_buckets),
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "average_delay": self.total_delay / self.throttled if self.throttled else 0.0,
+                "max_delay": self.max_delay,
+                "flood_errors": self.flood_errors,
+            }
+
+
+def _get_retry_after(error):
+    if error.error_code != 429:
+        return None
+    parameters = (error.result_json or {}).get("parameters") or {}
+    return parameters.get("retry_after", 1)
+
+
+class RateLimitedBot:
+    """
+    Обгортка над telebot.TeleBot: надсилання і редагування повідомлень проходять через
+    OutboundLimiter, а після 429 запит повторюється через retry_after. Решта атрибутів
+    (обробники, polling, answer_callback_query тощо) передається боту без змін.
+    """
+
+    def __init__(self, bot, limiter=None):
+        self.bot = bot
+        self.limiter = limiter or OutboundLimiter()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.bot, name)
+        if name in RESULT_METHODS:
+            return self._limited(attribute, PRIORITY_RESULT)
+        if name in PROGRESS_METHODS:
+            return self._limited(attribute, PRIORITY_PROGRESS)
+        return attribute
+
+    def _limited(self, method, priority):
+        def call(*args, **kwargs):
+            if method.__name__ == "reply_to":
+                chat_id = args[0].chat.id
+            else:
+                position = CHAT_ID_POSITION.get(method.__name__, 0)
+                chat_id = kwargs.get("chat_id", args[position] if len(args) > position else None)
+
+            for attempt in range(MAX_FLOOD_RETRIES + 1):
+                self.limiter.acquire(chat_id, priority)
+                try:
+                    return method(*args, **kwargs)
+                except telebot.apihelper.ApiTelegramException as e:
+                    retry_after = _get_retry_after(e)
+                    if retry_after is None or attempt == MAX_FLOOD_RETRIES:
+                        raise
+                    logger.warning(f"Telegram flood limit in chat {chat_id}, retrying in {retry_after}s")
+                    self.limiter.pause_chat(chat_id, retry_after)
+                    _rewind_files(args, kwargs)
+
+        return call
+
+    def try_call(self, name, chat_id, *args, **kwargs):
+        """
+        Виклик методу бота без очікування (для диспетчера прогресу, спільного для всіх чатів).
+        Якщо ліміт зайнятий або Telegram відповів 429, запит не виконується і повертається
+        час до наступної спроби; 0 — запит виконано
+        """
+        delay = self.limiter.try_acquire(chat_id, PRIORITY_PROGRESS)
+        if delay > 0:
+            return delay
+        try:
+            getattr(self.bot, name)(*args, **kwargs)
+        except telebot.apihelper.ApiTelegramException as e:
+            retry_after = _get_retry_after(e)
+            if retry_after is None:
+                raise
+            logger.warning(f"Telegram flood limit in chat {chat_id}, deferring {name} by {retry_after}s")
+            self.limiter.pause_chat(chat_id, retry_after)
+            return retry_after
+        return 0.0
+
+
+def _rewind_files(args, kwargs):
+    """Повертає відкриті файли на початок перед повторним надсиланням"""
+    for value in list(args) + list(kwargs.values()):
+        if hasattr(value, "seek"):
+            value.seek(0)
@@ -0,0 +1,180 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Сесія користувача живе стільки після останнього звернення до неї
+SESSION_TTL = 24 * 3600
+MAX_SESSIONS = 10000
+SESSION_KEY_PREFIX = "spbot:session"
+
+_MISSING = object()
+
+
+class SessionEntry:
+    __slots__ = ("value", "weight", "expires_at")
+
+    def __init__(self, value, weight, expires_at):
+        self.value = value
+        self.weight = weight
+        self.expires_at = expires_at
+
+
+def weigh_value(value):
+    """Вага запису: кількість елементів для списків (плейлисти), інакше 1"""
+    return max(len(value), 1) if isinstance(value, (list, tuple)) else 1
+
+
+class SessionStore:
+    """
+    Словникоподібне сховище сесій користувачів у пам'яті. Кожне звернення продовжує життя
+    запису на ttl секунд; записи впорядковані за останнім зверненням, тож прострочені завжди
+    на початку і видаляються під час запису. Якщо перевищено max_entries або сумарну вагу
+    max_weight, видаляються найдавніше використані записи.
+    """
+
+    def __init__(self, name, ttl=SESSION_TTL, max_entries=MAX_SESSIONS, max_weight=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+        self.entries = OrderedDict()  # {key: SessionEntry}
+        self.total_weight = 0
+        self.lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.total_weight -= entry.weight
+        return entry
+
+    def _purge(self, now):
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if entry.expires_at >= now:
+                break
+            self._remove(key)
+            self.expirations += 1
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            if entry.expires_at < now:
+                self._remove(key)
+                self.expirations += 1
+                return default
+            entry.expires_at = now + self.ttl
+            self.entries.move_to_end(key)
+            return entry.value
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        now = time.monotonic()
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self._purge(now)
+            entry = SessionEntry(value, weigh_value(value), now + self.ttl)
+            self.entries[key] = entry
+            self.total_weight += entry.weight
+            while len(self.entries) > 1 and (len(self.entries) > self.max_entries or (
+                    self.max_weight is not None and self.total_weight > self.max_weight)):
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def __delitem__(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            entry = self._remove(key)
+            return entry.value if entry.expires_at >= time.monotonic() else default
+
+    def __len__(self):
+        with self.lock:
+            self._purge(time.monotonic())
+            return len(self.entries)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "weight": self.total_weight,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class RedisSessionStore:
+    """
+    Той самий інтерфейс, але записи зберігаються в Redis як JSON з TTL, тож кілька процесів
+    бота бачать спільні сесії і вони переживають перезапуск. Обмеження пам'яті забезпечує
+    сам Redis (maxmemory з політикою allkeys-lru або volatile-lru).
+    """
+
+    def __init__(self, redis_client, name, ttl=SESSION_TTL):
+        self.redis = redis_client
+        self.name = name
+        self.ttl = ttl
+        self.prefix = f"{SESSION_KEY_PREFIX}:{name}:"
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def get(self, key, default=None):
+        # GETEX повертає значення і водночас продовжує його життя
+        raw = self.redis.getex(self._key(key), ex=self.ttl)
+        if raw is None:
+            return default
+        return json.loads(raw)
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.redis.set(self._key(key), json.dumps(value, ensure_ascii=False), ex=self.ttl)
+
+    def __delitem__(self, key):
+        if not self.redis.delete(self._key(key)):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return bool(self.redis.exists(self._key(key)))
+
+    def pop(self, key, default=None):
+        raw = self.redis.getdel(self._key(key))
+        return default if raw is None else json.loads(raw)
+
+    def __len__(self):
+        return sum(1 for _ in self.redis.scan_iter(match=f"{self.prefix}*", count=1000))
+
+    def stats(self):
+        return {"entries": len(self)}
+
+
+def create_session_store(name, redis_client=None, ttl=SESSION_TTL, **kwargs):
+    """Сховище в Redis, якщо передано клієнт, інакше в пам'яті процесу"""
+    if redis_client is not None:
+        return RedisSessionStore(redis_client, name, ttl)
+    return SessionStore(name, ttl, **kwargs)
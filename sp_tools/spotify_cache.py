@@ -0,0 +1,98 @@
+import logging
+
+from spotipy import SpotifyException
+
+from sp_tools.ttl_cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+# Час життя записів (секунди)
+TRACK_TTL = 24 * 3600
+ALBUM_TTL = 24 * 3600
+SEARCH_TTL = 6 * 3600
+# Порожні результати пошуку і 404 пам'ятаємо коротше
+NEGATIVE_TTL = 30 * 60
+SPOTIFY_CACHE_MAX_ENTRIES = 20000
+
+
+class CachedSpotify:
+    """
+    Обгортка над spotipy.Spotify з TTL-кешем для track, tracks, album і search.
+    Результати пошуку заповнюють кеш треків, тож подальші виклики sp.track для тих самих ID
+    не йдуть у мережу. Елементи плейлистів кеш не заповнюють: сторінки запитуються лише з
+    потрібними полями, а не з повними об'єктами треків. Інші методи передаються клієнту без змін.
+    """
+
+    def __init__(self, client, cache=None):
+        self.client = client
+        self.cache = cache or TTLCache(max_entries=SPOTIFY_CACHE_MAX_ENTRIES)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def remember_track(self, track):
+        """Додає повний об'єкт треку (з пошуку чи пакетного запиту) в кеш"""
+        if track and track.get('id'):
+            self.cache.set(("track", track['id']), track, TRACK_TTL)
+
+    def _cached_call(self, key, ttl, loader):
+        value = self.cache.get(key)
+        if value is not MISSING:
+            if isinstance(value, SpotifyException):
+                raise value
+            return value
+
+        try:
+            value = loader()
+        except SpotifyException as e:
+            # Неіснуючі об'єкти кешуємо, щоб не повторювати запит
+            if e.http_status == 404:
+                self.cache.set(key, e, NEGATIVE_TTL)
+            raise
+
+        self.cache.set(key, value, ttl)
+        return value
+
+    def track(self, track_id, market=None):
+        key = ("track", track_id) if market is None else ("track", track_id, market)
+        return self._cached_call(key, TRACK_TTL, lambda: self.client.track(track_id, market=market))
+
+    def tracks(self, tracks, market=None):
+        """Пакетний запит треків: з мережі завантажуються лише відсутні в кеші (по 50 за раз)"""
+        result = {}
+        missing = []
+        for track_id in tracks:
+            cached = self.cache.get(("track", track_id))
+            if cached is MISSING or isinstance(cached, SpotifyException):
+                missing.append(track_id)
+            else:
+                result[track_id] = cached
+
+        for i in range(0, len(missing), 50):
+            response = self.client.tracks(missing[i:i + 50], market=market)
+            for track in response.get('tracks', []):
+                if track:
+                    self.remember_track(track)
+                    result[track['id']] = track
+
+        return {"tracks": [result.get(track_id) for track_id in tracks]}
+
+    def album(self, album_id, market=None):
+        return self._cached_call(("album", album_id, market), ALBUM_TTL,
+                                 lambda: self.client.album(album_id, market=market))
+
+    def search(self, q, limit=10, offset=0, type="track", market=None):
+        key = ("search", " ".join(q.lower().split()), limit, offset, type, market)
+        value = self.cache.get(key)
+        if value is not MISSING:
+            return value
+
+        value = self.client.search(q, limit=limit, offset=offset, type=type, market=market)
+
+        items = value.get('tracks', {}).get('items', []) if isinstance(value, dict) else []
+        for track in items:
+            self.remember_track(track)
+
+        # Порожній результат — негативне кешування з коротшим часом життя
+        self.cache.set(key, value, SEARCH_TTL if items or type != "track" else NEGATIVE_TTL)
+        return value
@@ -0,0 +1,127 @@
+import logging
+import re
+
+import mutagen
+from mutagen.flac import FLAC, Picture
+from mutagen.id3 import ID3, APIC, SYLT, TALB, TIT2, TPE1, USLT, ID3NoHeaderError, Encoding
+from mutagen.mp4 import MP4, MP4Cover
+from mutagen.wave import WAVE
+
+logger = logging.getLogger(__name__)
+
+LRC_LINE_PATTERN = re.compile(r"\[(\d{1,2}):(\d{2})(?:[.:](\d{1,3}))?\](.*)")
+
+
+def get_audio_duration(file_path):
+    """Повертає тривалість у секундах із заголовків контейнера (без декодування аудіо)"""
+    audio = mutagen.File(file_path)
+    if audio is None or audio.info is None:
+        return None
+    return audio.info.length
+
+
+def parse_synced_lyrics(lyrics):
+    """Розбирає LRC у список (текст, час у мс). Порожній список — лірика не синхронізована"""
+    if not lyrics:
+        return []
+
+    lines = []
+    for line in lyrics.splitlines():
+        match = LRC_LINE_PATTERN.match(line.strip())
+        if not match:
+            continue
+        minutes, seconds, fraction, text = match.groups()
+        fraction = (fraction or "0").ljust(3, "0")[:3]
+        milliseconds = (int(minutes) * 60 + int(seconds)) * 1000 + int(fraction)
+        lines.append((text.strip(), milliseconds))
+    return lines
+
+
+def _lyrics_fit_duration(synced_lines, duration):
+    """Перевіряє, що синхронізована лірика не виходить за межі треку (допуск 1 секунда)"""
+    if not synced_lines or duration is None:
+        return True
+    return synced_lines[-1][1] / 1000 <= duration + 1
+
+
+def _tag_id3(tags, title, artist, album, cover_image_data, lyrics, synced_lines):
+    """Заповнює ID3-теги (MP3 і WAV)"""
+    if title:
+        tags.setall("TIT2", [TIT2(encoding=Encoding.UTF8, text=[title])])
+    if artist:
+        tags.setall("TPE1", [TPE1(encoding=Encoding.UTF8, text=[artist])])
+    if album:
+        tags.setall("TALB", [TALB(encoding=Encoding.UTF8, text=[album])])
+    if cover_image_data:
+        tags.setall("APIC", [APIC(encoding=Encoding.UTF8, mime="image/jpeg", type=3, desc="Cover",
+                                  data=cover_image_data)])
+    if lyrics:
+        tags.setall("USLT", [USLT(encoding=Encoding.UTF8, lang="eng", desc="", text=lyrics)])
+    if synced_lines:
+        # format=2 — час у мілісекундах, type=1 — текст пісні
+        tags.setall("SYLT", [SYLT(encoding=Encoding.UTF8, lang="eng", format=2, type=1, desc="",
+                                  text=synced_lines)])
+
+
+def tag_audio_file(file_path, audio_format, title=None, artist=None, album=None, cover_image_data=None,
+                   lyrics=None):
+    """
+    Записує обкладинку, виконавця, назву, альбом і текст (зокрема синхронізований LRC)
+    для mp3, m4a, flac та wav. Працює лише з тегами — аудіо не декодується і ffmpeg не запускається.
+    """
+    synced_lines = parse_synced_lyrics(lyrics)
+    if synced_lines and not _lyrics_fit_duration(synced_lines, get_audio_duration(file_path)):
+        logger.info(f"Synced lyrics are longer than {file_path}, skipping lyrics")
+        lyrics, synced_lines = None, []
+
+    if audio_format == "mp3":
+        try:
+            tags = ID3(file_path)
+        except ID3NoHeaderError:
+            tags = ID3()
+        _tag_id3(tags, title, artist, album, cover_image_data, lyrics, synced_lines)
+        tags.save(file_path)
+
+    elif audio_format == "wav":
+        audio = WAVE(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        _tag_id3(audio.tags, title, artist, album, cover_image_data, lyrics, synced_lines)
+        audio.save()
+
+    elif audio_format == "m4a":
+        audio = MP4(file_path)
+        if title:
+            audio["\xa9nam"] = [title]
+        if artist:
+            audio["\xa9ART"] = [artist]
+        if album:
+            audio["\xa9alb"] = [album]
+        if cover_image_data:
+            audio["covr"] = [MP4Cover(cover_image_data, imageformat=MP4Cover.FORMAT_JPEG)]
+        if lyrics:
+            audio["\xa9lyr"] = [lyrics]
+        audio.save()
+
+    elif audio_format == "flac":
+        audio = FLAC(file_path)
+        if title:
+            audio["TITLE"] = title
+        if artist:
+            audio["ARTIST"] = artist
+        if album:
+            audio["ALBUM"] = album
+        if lyrics:
+            audio["LYRICS"] = lyrics
+        if cover_image_data:
+            picture = Picture()
+            picture.type = 3
+            picture.mime = "image/jpeg"
+            picture.desc = "Cover"
+            picture.data = cover_image_data
+            audio.clear_pictures()
+            audio.add_picture(picture)
+        audio.save()
+
+    else:
+        raise ValueError(f"Непідтримуваний формат для тегів: {audio_format}")
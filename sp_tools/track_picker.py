@@ -0,0 +1,60 @@
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from sp_tools.download_pool import get_track_display_name
+
+TRACKS_PER_PAGE = 10
+# Telegram обрізає довгі підписи кнопок, тому скорочуємо назви самі
+MAX_BUTTON_TEXT = 60
+
+
+def toggle_selection(selection, index):
+    """Вибрані треки зберігаються як бітова маска (int): біт index — трек index"""
+    return selection ^ (1 << index)
+
+
+def is_selected(selection, index):
+    return bool(selection >> index & 1)
+
+
+def get_selected_indexes(selection, total):
+    return [index for index in range(total) if is_selected(selection, index)]
+
+
+def get_page_count(total):
+    return max(1, (total + TRACKS_PER_PAGE - 1) // TRACKS_PER_PAGE)
+
+
+def get_page_of(index):
+    return index // TRACKS_PER_PAGE
+
+
+def create_track_picker_keyboard(tracks, page=0, selection=0):
+    """
+    Клавіатура лише з треками поточної сторінки. Натискання на трек вибирає або
+    знімає вибір, навігація між сторінками і завантаження вибраних — окремими рядками.
+    """
+    total = len(tracks)
+    page_count = get_page_count(total)
+    page = min(max(page, 0), page_count - 1)
+    start = page * TRACKS_PER_PAGE
+
+    markup = InlineKeyboardMarkup(row_width=3)
+    for index in range(start, min(start + TRACKS_PER_PAGE, total)):
+        track_name = get_track_display_name(tracks[index])
+        if len(track_name) > MAX_BUTTON_TEXT:
+            track_name = track_name[:MAX_BUTTON_TEXT - 1] + "…"
+        mark = "✅" if is_selected(selection, index) else "▫️"
+        markup.row(InlineKeyboardButton(f"{mark} {index + 1}. {track_name}", callback_data=f"pick_{index}"))
+
+    if page_count > 1:
+        markup.row(
+            InlineKeyboardButton("◀️", callback_data=f"page_{(page - 1) % page_count}"),
+            InlineKeyboardButton(f"{page + 1}/{page_count}", callback_data="page_noop"),
+            InlineKeyboardButton("▶️", callback_data=f"page_{(page + 1) % page_count}")
+        )
+
+    selected_count = bin(selection).count("1")
+    if selected_count:
+        markup.row(InlineKeyboardButton(f"Завантажити вибрані ({selected_count})", callback_data="download_selected"))
+    markup.row(InlineKeyboardButton(f"Завантажити все ({total})", callback_data="download_all"))
+    return markup
@@ -0,0 +1,71 @@
+import logging
+import os
+import subprocess
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Локальна збірка ffmpeg з папки tools (Windows), інакше — ffmpeg з PATH
+FFMPEG_BINARY = "tools/FFMpeg/ffmpeg.exe" if os.path.exists("tools/FFMpeg/ffmpeg.exe") else "ffmpeg"
+
+# Бітрейт MP3. Єдине місце, де він задається: входить і в профіль кешу (AUDIO_PROFILE)
+MP3_BITRATE = "320k"
+
+# Параметри кодування для кожного формату з меню вибору
+OUTPUT_FORMATS = {
+    "mp3": ["-c:a", "libmp3lame", "-b:a", MP3_BITRATE],
+    "m4a": ["-c:a", "aac", "-b:a", "256k", "-movflags", "+faststart"],
+    "flac": ["-c:a", "flac", "-compression_level", "5"],
+    "wav": ["-c:a", "pcm_s16le"],
+}
+
+# Нормалізація гучності за EBU R128 прямо у фільтрі ffmpeg
+NORMALIZE_FILTER = "loudnorm=I=-14:TP=-1.0:LRA=11"
+OUTPUT_SAMPLE_RATE = "44100"
+
+# Одночасних процесів ffmpeg на весь процес бота: кожен завантажує ядро CPU повністю,
+# тож більше процесів, ніж ядер, лише сповільнює всі треки разом
+FFMPEG_SLOTS = os.cpu_count() or 2
+ffmpeg_slots = threading.BoundedSemaphore(FFMPEG_SLOTS)
+
+
+def run_ffmpeg(command):
+    """Запускає ffmpeg, коли звільниться слот CPU; повертає CompletedProcess зі stderr"""
+    with ffmpeg_slots:
+        return subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def build_transcode_command(source_path, output_path, audio_format="mp3", normalize=True, gain_db=None):
+    """
+    Формує команду ffmpeg для перекодування за один прохід.
+    gain_db — заздалегідь виміряне підсилення (лінійне, без динамічної обробки);
+    якщо його немає, а normalize=True, використовується loudnorm.
+    """
+    if audio_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Непідтримуваний формат: {audio_format}")
+
+    command = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", "-i", source_path, "-vn"]
+    if gain_db is not None:
+        command += ["-af", f"volume={gain_db}dB"]
+    elif normalize:
+        command += ["-af", NORMALIZE_FILTER]
+    # loudnorm за замовчуванням передискретизує до 192 кГц, тому задаємо частоту явно
+    command += ["-ar", OUTPUT_SAMPLE_RATE]
+    command += OUTPUT_FORMATS[audio_format]
+    command.append(output_path)
+    return command
+
+
+def transcode_audio(source_path, output_path, audio_format="mp3", normalize=True, gain_db=None):
+    """
+    Перекодовує завантажений файл (webm/opus, m4a...) одразу в цільовий формат.
+    ffmpeg обробляє потік блоками, тому пам'ять не залежить від тривалості треку,
+    а проміжний WAV на диску не потрібен.
+    """
+    command = build_transcode_command(source_path, output_path, audio_format, normalize, gain_db)
+    result = run_ffmpeg(command)
+    if result.returncode != 0:
+        error = result.stderr.decode("utf-8", errors="replace").strip()
+        logger.error(f"ffmpeg failed for {source_path}: {error}")
+        raise RuntimeError(f"Помилка ffmpeg: {error[-300:]}")
+    return output_path
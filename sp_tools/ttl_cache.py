@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Позначка відсутнього значення (None теж може бути закешованим результатом)
+MISSING = object()
+# Як часто фоновий потік видаляє прострочені записи з кешів
+PURGE_INTERVAL = 3600
+
+
+class TTLCache:
+    """
+    Потокобезпечний кеш у пам'яті з часом життя для кожного запису
+    та обмеженням кількості записів (найдавніше використані видаляються першими).
+    """
+
+    def __init__(self, max_entries=10000, default_ttl=3600):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.entries = OrderedDict()  # {key: (expires_at, value)}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=MISSING):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < now:
+                del self.entries[key]
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def purge_expired(self):
+        """Видаляє прострочені записи (викликається зрідка, щоб звільнити пам'ять)"""
+        now = time.monotonic()
+        with self.lock:
+            expired = [key for key, (expires_at, _) in self.entries.items() if expires_at < now]
+            for key in expired:
+                del self.entries[key]
+        return len(expired)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        with self.lock:
+            requests_total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests_total if requests_total else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+def start_purge_thread(stores, interval=PURGE_INTERVAL):
+    """
+    Запускає фоновий потік, який кожні interval секунд викликає purge_expired у кожного сховища:
+    прострочені записи, до яких більше не звертаються, інакше лежали б до витіснення
+    """
+    def purge_loop():
+        while True:
+            time.sleep(interval)
+            for store in stores:
+                try:
+                    purged = store.purge_expired()
+                except Exception as e:
+                    logger.warning(f"Failed to purge expired entries: {str(e)}")
+                    continue
+                if purged:
+                    logger.info(f"Purged {purged} expired entries from {type(store).__name__}")
+
+    thread = threading.Thread(target=purge_loop, name="cache-purge", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,171 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+from rapidfuzz import fuzz, utils
+
+logger = logging.getLogger(__name__)
+
+VIDEO_MATCH_STORE_PATH = "cache/video_matches.sqlite3"
+MATCH_WORKERS = 6
+SEARCH_LIMIT = 10
+# Ваги складових оцінки кандидата (сума — 1)
+TITLE_WEIGHT = 0.45
+ARTIST_WEIGHT = 0.35
+DURATION_WEIGHT = 0.2
+# Різниця тривалості (секунди), за якої складова тривалості стає нульовою
+DURATION_TOLERANCE = 15
+# Збіги з оцінкою від CONFIRMED_SCORE зберігаються в спільному кеші
+CONFIRMED_SCORE = 75
+NON_WORD_PATTERN = re.compile(r"[^\w]+")
+
+
+def make_name_key(artist, title):
+    """
+    Ключ за нормалізованими першим виконавцем і повною назвою. На відміну від ключа текстів
+    пісень, примітки на кшталт "(Live)" чи "- Radio Edit" зберігаються: це інші записи
+    """
+    artist = (artist or "").split(",")[0]
+    normalized = [" ".join(NON_WORD_PATTERN.sub(" ", unicodedata.normalize("NFKC", text).lower()).split())
+                  for text in (artist, title or "")]
+    return f"track:{normalized[0]}|{normalized[1]}"
+
+
+def make_match_keys(track):
+    """Ключі треку для кешу відповідностей: ID джерела, ISRC і нормалізовані виконавець/назва"""
+    keys = []
+    if track.get('id'):
+        keys.append(f"sp:{track['id']}")
+    if track.get('deezer_id'):
+        keys.append(f"dz:{track['deezer_id']}")
+    if track.get('isrc'):
+        keys.append(f"isrc:{track['isrc'].upper()}")
+    keys.append(make_name_key(track['artist'], track['name']))
+    return keys
+
+
+def get_track_duration(track):
+    """Тривалість треку в секундах (duration_ms зі Spotify або duration з Deezer)"""
+    if track.get('duration_ms'):
+        return track['duration_ms'] / 1000
+    return track.get('duration')
+
+
+def score_candidate(track, candidate):
+    """Оцінка 0–100 кандидата з ytmusic.search: схожість назви, виконавця і тривалості"""
+    title_score = fuzz.token_set_ratio(track['name'], candidate.get('title') or "",
+                                       processor=utils.default_process)
+    candidate_artists = " ".join(artist['name'] for artist in candidate.get('artists') or [])
+    artist_score = fuzz.token_set_ratio(track['artist'], candidate_artists, processor=utils.default_process)
+
+    duration = get_track_duration(track)
+    candidate_duration = candidate.get('duration_seconds')
+    if duration and candidate_duration:
+        duration_score = max(0.0, 1 - abs(duration - candidate_duration) / DURATION_TOLERANCE) * 100
+    else:
+        # Тривалість невідома — не штрафуємо і не заохочуємо
+        duration_score = 50
+
+    return TITLE_WEIGHT * title_score + ARTIST_WEIGHT * artist_score + DURATION_WEIGHT * duration_score
+
+
+class VideoMatchStore:
+    """Постійний спільний кеш підтверджених відповідностей трек -> videoId YouTube Music"""
+
+    def __init__(self, db_path=VIDEO_MATCH_STORE_PATH):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS video_matches (
+                key TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                score REAL NOT NULL,
+                matched_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+
+    def get(self, keys):
+        with self.lock:
+            for key in keys:
+                row = self.connection.execute(
+                    "SELECT video_id FROM video_matches WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    return row[0]
+        return None
+
+    def put(self, keys, video_id, score):
+        now = time.time()
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO video_matches VALUES (?, ?, ?, ?)",
+                [(key, video_id, score, now) for key in keys]
+            )
+            self.connection.commit()
+
+
+class VideoMatcher:
+    """
+    Пошук відповідного відео на YouTube Music для треків. Кандидати ранжуються за назвою,
+    виконавцем і тривалістю (RapidFuzz), а не береться перший результат. prefetch() шукає
+    одразу весь плейлист в обмеженому пулі потоків; match() для треку, який уже шукається,
+    чекає на той самий запит замість повторного пошуку.
+    """
+
+    def __init__(self, ytmusic, store=None, workers=MATCH_WORKERS):
+        self.ytmusic = ytmusic
+        self.store = store or VideoMatchStore()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="video-match")
+        self.in_flight = {}  # {ключ треку: Future}
+        self.lock = threading.Lock()
+
+    def _search(self, track, keys):
+        try:
+            video_id = self.store.get(keys)
+            if video_id:
+                return video_id
+
+            query = f"{track['artist']} - {track['name']}"
+            candidates = [result for result in self.ytmusic.search(query=query, filter="songs", limit=SEARCH_LIMIT)
+                          if result.get('videoId')]
+            if not candidates:
+                return None
+
+            score, best = max(((score_candidate(track, candidate), candidate) for candidate in candidates),
+                              key=lambda scored: scored[0])
+            if score >= CONFIRMED_SCORE:
+                self.store.put(keys, best['videoId'], score)
+            else:
+                logger.info(f"Weak match for {query}: {best.get('title')} ({score:.0f}), not caching")
+            return best['videoId']
+        finally:
+            with self.lock:
+                self.in_flight.pop(keys[0], None)
+
+    def _submit(self, track):
+        keys = make_match_keys(track)
+        with self.lock:
+            future = self.in_flight.get(keys[0])
+            if future is None:
+                future = self.executor.submit(self._search, track, keys)
+                self.in_flight[keys[0]] = future
+            return future
+
+    def prefetch(self, tracks):
+        """Запускає пошук для всіх треків у фоні, не чекаючи на результат"""
+        for track in tracks:
+            if not track.get('is_youtube'):
+                self._submit(track)
+
+    def match(self, track):
+        """Повертає videoId для треку або None, якщо нічого не знайдено"""
+        return self._submit(track).result()
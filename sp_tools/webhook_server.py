@@ -0,0 +1,62 @@
+import hmac
+import json
+import logging
+import time
+from typing import Optional
+
+import telebot
+from fastapi import FastAPI, Request, Header, HTTPException, BackgroundTasks
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/telegram/webhook"
+
+
+def create_webhook_app(bot, secret_token, health_info=None):
+    """
+    FastAPI-застосунок для режиму webhook. Telegram надсилає оновлення POST-запитом
+    із заголовком X-Telegram-Bot-Api-Secret-Token; після перевірки токена відповідь
+    повертається одразу, а оновлення обробляється у фоні тими самими обробниками бота.
+    Локально можна перевірити, надіславши збережене оновлення:
+        curl -X POST -H "X-Telegram-Bot-Api-Secret-Token: <секрет>" -d @update.json localhost:8080/telegram/webhook
+    """
+    app = FastAPI()
+    started = time.time()
+    counters = {"received": 0, "rejected": 0, "failed": 0}
+
+    def process_update(update):
+        try:
+            bot.process_new_updates([update])
+        except Exception as e:
+            counters["failed"] += 1
+            logger.exception(f"Error processing update {update.update_id}: {str(e)}")
+
+    @app.post(WEBHOOK_PATH)
+    async def receive_update(request: Request, background_tasks: BackgroundTasks,
+                             x_telegram_bot_api_secret_token: Optional[str] = Header(default=None)):
+        # Порівнюємо байти: compare_digest для рядків з не-ASCII символами кидає TypeError
+        received = (x_telegram_bot_api_secret_token or "").encode("utf-8")
+        if not hmac.compare_digest(received, secret_token.encode("utf-8")):
+            counters["rejected"] += 1
+            raise HTTPException(status_code=403, detail="invalid secret token")
+
+        try:
+            update = telebot.types.Update.de_json(json.loads(await request.body()))
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=400, detail="invalid update")
+
+        counters["received"] += 1
+        # Обробка відбувається після відповіді, тож Telegram не чекає на обробники
+        background_tasks.add_task(process_update, update)
+        return {"ok": True}
+
+    # Звичайна функція: FastAPI виконає її в пулі потоків, і синхронна статистика
+    # (SQLite, Redis) не блокуватиме цикл подій, що приймає оновлення
+    @app.get("/health")
+    def health():
+        info = {"status": "ok", "uptime": round(time.time() - started), **counters}
+        if health_info:
+            info.update(health_info())
+        return info
+
+    return app
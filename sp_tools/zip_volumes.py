@@ -0,0 +1,87 @@
+import logging
+import os
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+# Ліміт Telegram для ботів — 50 МБ, залишаємо запас
+ZIP_VOLUME_LIMIT = 49 * 1024 * 1024
+# Стиснуті формати повторно не стискаємо — це лише витрата CPU
+STORED_EXTENSIONS = {".mp3", ".m4a", ".flac", ".ogg", ".opus", ".aac", ".jpg", ".jpeg", ".png", ".mp4"}
+# Розміри службових структур ZIP (без імені файлу)
+LOCAL_HEADER_SIZE = 30
+CENTRAL_HEADER_SIZE = 46
+END_OF_CENTRAL_DIRECTORY_SIZE = 22
+
+
+def get_zip_compression(file_path):
+    """STORED для вже стиснутих форматів, DEFLATED для решти (наприклад, WAV)"""
+    if os.path.splitext(file_path)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+class ZipVolumeWriter:
+    """
+    Пише ZIP-архів томами на диск: кожен трек дописується одразу після завантаження,
+    а новий том починається, щойно наступний файл не вміщується в max_bytes.
+    У пам'яті не тримається нічого, крім буфера копіювання одного файлу.
+    """
+
+    def __init__(self, folder, base_name="tracks", max_bytes=ZIP_VOLUME_LIMIT, on_volume_closed=None):
+        self.folder = folder
+        self.base_name = base_name
+        self.max_bytes = max_bytes
+        self.on_volume_closed = on_volume_closed
+        self.volumes = []
+        self.zip_file = None
+        self.volume_path = None
+        self.volume_bytes = 0
+        self.directory_bytes = 0
+
+    def _open_volume(self):
+        self.volume_path = os.path.join(self.folder, f"{self.base_name}_part{len(self.volumes) + 1}.zip")
+        self.zip_file = zipfile.ZipFile(self.volume_path, "w", allowZip64=True)
+        self.volume_bytes = 0
+        self.directory_bytes = END_OF_CENTRAL_DIRECTORY_SIZE
+
+    def _close_volume(self):
+        self.zip_file.close()
+        self.zip_file = None
+        self.volumes.append(self.volume_path)
+        if self.on_volume_closed:
+            self.on_volume_closed(self.volume_path, len(self.volumes))
+
+    def add(self, file_path, arcname=None):
+        """Дописує файл у поточний том, за потреби закриваючи його і починаючи новий"""
+        arcname = arcname or os.path.basename(file_path)
+        name_size = len(arcname.encode("utf-8"))
+        # Для DEFLATED розмір після стиснення невідомий заздалегідь — беремо верхню межу
+        entry_bytes = LOCAL_HEADER_SIZE + name_size + os.path.getsize(file_path)
+        directory_entry_bytes = CENTRAL_HEADER_SIZE + name_size
+
+        if self.zip_file is not None and self.volume_bytes and (
+                self.volume_bytes + entry_bytes + self.directory_bytes + directory_entry_bytes > self.max_bytes):
+            self._close_volume()
+        if self.zip_file is None:
+            self._open_volume()
+
+        if entry_bytes + self.directory_bytes + directory_entry_bytes > self.max_bytes:
+            logger.warning(f"{arcname} is larger than a ZIP volume, it gets a volume of its own")
+
+        self.zip_file.write(file_path, arcname=arcname, compress_type=get_zip_compression(file_path))
+        info = self.zip_file.infolist()[-1]
+        self.volume_bytes += LOCAL_HEADER_SIZE + name_size + len(info.extra) + info.compress_size
+        self.directory_bytes += directory_entry_bytes + len(info.extra)
+
+    def discard(self):
+        """Закриває недописаний том після помилки, не передаючи його в on_volume_closed"""
+        if self.zip_file is not None:
+            self.zip_file.close()
+            self.zip_file = None
+
+    def close(self):
+        """Закриває останній том і повертає шляхи до всіх томів"""
+        if self.zip_file is not None:
+            self._close_volume()
+        return self.volumes
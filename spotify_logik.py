@@ -1,21 +1,31 @@
-import io
 import re
-import zipfile
 import sys
-import eyed3
 from datetime import datetime
-from pydub import AudioSegment
 from syncedlyrics import search
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 import yt_dlp
 import transliterate
-import requests
 from spotipy import Spotify
 from spotipy.oauth2 import SpotifyClientCredentials
 from ytmusicapi import YTMusic
 from outh_data import token, CLIENT_ID, CLIENT_SECRET
 import  telebot
+from sp_tools.audio_cache import AudioCache
+from sp_tools.spotify_cache import CachedSpotify
+from sp_tools.transcode import transcode_audio, OUTPUT_FORMATS, MP3_BITRATE
+from sp_tools.loudness import LoudnessStore, write_loudness_tags, LOUDNESS_MODE_RENDER, LOUDNESS_MODE_TAG
+from sp_tools.tagging import tag_audio_file
+from sp_tools.enrichment import start_enrichment
+from sp_tools.file_id_store import TelegramFileIdStore, make_track_key
+from sp_tools.cover_store import CoverStore
+from sp_tools.lyrics_store import LyricsStore
+from sp_tools.lyrics_resolver import LyricsResolver
+from sp_tools.video_matcher import VideoMatcher
+from sp_tools.progress_dispatcher import get_progress_dispatcher
+from sp_tools.rate_limiter import RateLimitedBot
+from sp_tools.http_sessions import get_session, session_registry
 
 log_directory = "logs"
 if not os.path.exists(log_directory):
@@ -56,9 +66,34 @@ def handle_exception(exc_type, exc_value, exc_traceback):
 
 
 sys.excepthook = handle_exception
-bot = telebot.TeleBot(token)
-sp = Spotify(auth_manager=SpotifyClientCredentials(client_id=CLIENT_ID, client_secret=CLIENT_SECRET))
-ytmusic = YTMusic()
+# Запити telebot з усіх потоків використовують один пул з'єднань
+telebot.apihelper.session = get_session("telegram")
+# Усі надсилання проходять через спільний обмежувач швидкості Telegram
+bot = RateLimitedBot(telebot.TeleBot(token))
+# Клієнт Spotify з TTL-кешем для track/album/search (спільний для всіх потоків)
+sp = CachedSpotify(Spotify(
+    auth_manager=SpotifyClientCredentials(client_id=CLIENT_ID, client_secret=CLIENT_SECRET,
+                                          requests_session=get_session("spotify")),
+    requests_session=get_session("spotify")
+))
+ytmusic = YTMusic(requests_session=get_session("ytmusic"))
+audio_cache = AudioCache()
+telegram_file_ids = TelegramFileIdStore()
+loudness_store = LoudnessStore()
+cover_store = CoverStore()
+lyrics_store = LyricsStore()
+video_matcher = VideoMatcher(ytmusic)
+
+
+def get_runtime_stats():
+    """Лічильники лімітера Telegram, HTTP-сесій і кешів для /health та команди !статистика"""
+    return {
+        "telegram_limiter": bot.limiter.stats(),
+        "http": session_registry.stats(),
+        "audio_cache": audio_cache.stats(),
+        "lyrics_store": lyrics_store.stats(),
+        "spotify_cache": sp.cache.stats(),
+    }
 
 # Константи
 # Отримуємо шлях до файлу spotify_logik.py
@@ -86,24 +121,65 @@ def get_playlist_id(url):
     return match.group(1) if match else None
 
 
-def get_tracks_from_playlist(playlist_url):
-    """Отримує треки з плейлиста Spotify"""
+# Зі Spotify запитуємо лише поля, з яких складається компактний запис треку
+PLAYLIST_PAGE_SIZE = 100
+PLAYLIST_ITEM_FIELDS = ("items(track(id,name,duration_ms,external_ids(isrc),artists(name),"
+                        "album(id,name,images))),next")
+
+playlist_page_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="playlist-pages")
+
+
+def make_track_record(spotify_track):
+    """Компактний запис треку (замість повного JSON з API), який зберігається в сесіях і задачах"""
+    album = spotify_track.get('album') or {}
+    artists = spotify_track.get('artists') or [{}]
+    return {
+        "id": spotify_track.get('id'),
+        "name": spotify_track['name'],
+        "artist": artists[0].get('name') or "",
+        "album": album.get('name'),
+        "album_id": album.get('id'),
+        "isrc": (spotify_track.get('external_ids') or {}).get('isrc'),
+        "duration_ms": spotify_track.get('duration_ms'),
+        "cover_images": [{"url": image['url'], "width": image.get('width')} for image in album.get('images') or []],
+    }
+
+
+def iter_tracks_from_playlist(playlist_url):
+    """
+    Посторінково віддає треки плейлиста Spotify. Поки обробляються треки поточної
+    сторінки, наступна вже завантажується у фоні.
+    """
     playlist_id = get_playlist_id(playlist_url)
     if not playlist_id:
         raise ValueError("Невірний формат URL плейлиста")
 
-    results = sp.playlist_items(playlist_id)
-    tracks = []
+    def fetch_page(offset):
+        return sp.playlist_items(playlist_id, fields=PLAYLIST_ITEM_FIELDS, limit=PLAYLIST_PAGE_SIZE, offset=offset)
+
+    offset = 0
+    page_future = playlist_page_executor.submit(fetch_page, offset)
+    while page_future:
+        page = page_future.result()
+        offset += PLAYLIST_PAGE_SIZE
+        page_future = playlist_page_executor.submit(fetch_page, offset) if page.get('next') else None
+
+        for item in page["items"]:
+            if item.get("track"):  # Перевіряємо, чи трек існує
+                yield make_track_record(item["track"])
 
-    for item in results["items"]:
-        if item["track"]:  # Перевіряємо, чи трек існує
-            track = item["track"]
-            tracks.append({
-                "name": track["name"],
-                "artist": track["artists"][0]["name"],
-            })
 
-    return tracks
+def get_tracks_from_playlist(playlist_url):
+    """Отримує всі треки з плейлиста Spotify"""
+    return list(iter_tracks_from_playlist(playlist_url))
+
+
+def get_spotify_track_id(track):
+    """Повертає Spotify ID треку зі словника треку (поле id або посилання url)"""
+    if track.get('id'):
+        return track['id']
+    match = re.search(r'track/([a-zA-Z0-9]+)', track.get('url') or "")
+    return match.group(1) if match else None
 
 def get_cover_image(track_id):
     track = sp.track(track_id)
@@ -117,54 +193,17 @@ def get_cover_image(track_id):
 def download_cover_image(track_id):
     """
     Завантажує обкладинку треку з Spotify за його ID.
+    Обкладинки зберігаються за альбомом, тож треки одного альбому не завантажують її повторно.
     """
-    cover_url = get_cover_image(track_id)
-    if not cover_url:
-        return None
-
-    response = requests.get(cover_url)
-    if response.status_code == 200:
-        return response.content  # Повертаємо як bytes
-    return None
+    album = sp.track(track_id)['album']
+    cover_image_data, _ = cover_store.get(album['id'], album['images'])
+    return cover_image_data
 
 
 def add_metadata_to_mp3(mp3_path, cover_image_data, lyrics, artist_name, synced_lyrics=None):
-    audio_file = eyed3.load(mp3_path)
-    AudioSegment.converter = "tools/FFMpeg/ffmpeg.exe"
-    AudioSegment.ffprobe = "tools/FFMpeg/ffprobe.exe"
-    if audio_file.tag is None:
-        audio_file.initTag()
-
-    try:
-        audio = AudioSegment.from_file(mp3_path)
-    except Exception as e:
-        logger.exception(f"Error processing file {mp3_path}: {e}")
-        raise
-    audio_length = len(audio) / 1000  # у секундах
-
-    # Якщо є синхронізовані лірики, отримуємо їх тривалість
-    subtitles_length = None
-    if synced_lyrics:
-        timestamps = re.findall(r"\[(\d{2}):(\d{2})\.\d{2}\]", synced_lyrics)
-        if timestamps:
-            minutes, seconds = map(int, timestamps[-1])
-            subtitles_length = minutes * 60 + seconds
-
-    # Перевіряємо тривалість
-    if subtitles_length is not None:
-        if abs(audio_length - subtitles_length) > 1:  # допускаємо відхилення в 1 секунду
-            print("Довжини аудіо і субтитрів не співпадають. Вбудовування скасоване.")
-            return
-
-    # Вбудовуємо метадані
-    if cover_image_data:
-        audio_file.tag.images.set(3, cover_image_data, "image/jpeg")
-    if lyrics:
-        audio_file.tag.lyrics.set(lyrics)
-    if artist_name:
-        audio_file.tag.artist = artist_name
-
-    audio_file.tag.save()
+    """Додає обкладинку, текст і виконавця до MP3 (обгортка над tag_audio_file)"""
+    tag_audio_file(mp3_path, "mp3", artist=artist_name, cover_image_data=cover_image_data,
+                   lyrics=synced_lyrics or lyrics)
     print("Метадані успішно додано.")
 
 def search_track(track: str):
@@ -174,30 +213,44 @@ def search_track(track: str):
         return results[0]['videoId']  # Повертаємо videoId першого результату
     return None
 
-def get_synced_lyrics(track_name, artist_name):
+LYRICS_PROVIDERS = ['genius', 'musixmatch', 'lrclib']
+# Послівні мітки enhanced-LRC (<mm:ss.xx>) прибираємо, залишаючи построкову синхронізацію
+WORD_TIMESTAMP_PATTERN = r"<\d{2}:\d{2}\.\d{2}>"
+
+lyrics_resolver = LyricsResolver(search, LYRICS_PROVIDERS)
+
+
+def get_synced_lyrics(track_name, artist_name=None, isrc=None):
     if isinstance(track_name, dict):
-        search_term = f"{track_name['artist']} {track_name['name']}"
-    else:
-        search_term = f"{artist_name} {track_name}"
-    try:
-        lyrics = search(search_term, enhanced=True, synced_only=True, providers=['genius', 'musixmatch', 'lrclib'])
-        if lyrics:
-            pattern = r"<\d{2}:\d{2}\.\d{2}>"
-            lyrics = re.sub(pattern, "", lyrics)
-            print(f"Synced lyrics found: {lyrics}")
+        isrc = track_name.get('isrc')
+        track_name, artist_name = track_name['name'], track_name['artist']
+    search_term = f"{artist_name} {track_name}"
 
-            return lyrics
-        else:
-            lyrics = search(search_term, enhanced=True, providers=['genius', 'musixmatch', 'lrclib'])
-            pattern = r"<\d{2}:\d{2}\.\d{2}>"
-            lyrics = re.sub(pattern, "", lyrics)
-            print(f"Lyrics found: {lyrics}")
+    # Спершу кеш: і знайдені тексти, і відомі відсутні не потребують запитів до провайдерів
+    cached = lyrics_store.get(artist_name, track_name, isrc)
+    if cached is not None:
+        return cached.best()
 
-            return lyrics
+    try:
+        # Провайдери опитуються паралельно; синхронізований текст має перевагу над звичайним
+        resolution = lyrics_resolver.resolve(search_term)
     except Exception as e:
         logger.exception(f"Error getting lyrics: {e}")
         return None  # Повертаємо None замість підняття помилки
-    return None
+
+    lyrics = resolution.lyrics
+    if lyrics:
+        lyrics = re.sub(WORD_TIMESTAMP_PATTERN, "", lyrics)
+        print(f"{'Synced lyrics' if resolution.synced else 'Lyrics'} found: {lyrics}")
+
+    # Помилки мережі не кешуємо: якщо жоден провайдер не відповів, наступна спроба може бути вдалою.
+    # Порожній результат зберігається як негативний запис з коротким терміном
+    if lyrics or resolution.answered:
+        if resolution.synced:
+            lyrics_store.put(artist_name, track_name, synced=lyrics, isrc=isrc)
+        else:
+            lyrics_store.put(artist_name, track_name, plain=lyrics, isrc=isrc)
+    return lyrics
 
 
 class DownloadProgress:
@@ -216,128 +269,82 @@ class DownloadProgress:
         )
 
     def update_progress(self, progress):
-        """Оновлює повідомлення з прогресом"""
+        """Оновлює повідомлення з прогресом (диспетчер об'єднує часті оновлення в одне редагування)"""
         if self.status_message and progress != self.progress:
             self.progress = progress
             filled_blocks = int(progress / 10)
             empty_blocks = 10 - filled_blocks
             progress_bar = f"[{'■' * filled_blocks}{'□' * empty_blocks}] {progress}%"
 
-            try:
-                self.bot.edit_message_text(
-                    f"Завантаження '{self.track_name}' 🎵\n{progress_bar}",
-                    self.chat_id,
-                    self.status_message.message_id
-                )
-            except telebot.apihelper.ApiTelegramException:
-                # Ігноруємо помилку, якщо повідомлення не змінилося
-                pass
-
-    def complete(self):
-        """Позначає завантаження як завершене"""
-        if self.status_message:
-            self.bot.edit_message_text(
-                f"✅ Трек '{self.track_name}' успішно завантажено!",
+            get_progress_dispatcher(self.bot).update(
                 self.chat_id,
-                self.status_message.message_id
+                self.status_message.message_id,
+                f"Завантаження '{self.track_name}' 🎵\n{progress_bar}"
             )
 
+    def complete(self):
+        """Позначає завантаження як завершене"""
+        self.finish(f"✅ Трек '{self.track_name}' успішно завантажено!")
 
-def download_and_send_track(track, chat_id):
-    """Завантажує та надсилає трек з індикацією прогресу"""
-    global track_name, progress
-    try:
-        track_name = f"{track['artist']} - {track['name']}"
-        progress = DownloadProgress(bot, chat_id, track_name)
-        progress.send_initial_message()
-
-
-        file_path = f"{OUTPUT_DIR}/{track_name}"
-        mp3_path = f"{OUTPUT_DIR}/{track_name}.mp3"
-        temp_path = os.path.join(OUTPUT_DIR, f"{track_name}_temp")
-        final_path = os.path.join(OUTPUT_DIR, f"{track_name}.mp3")
-
-        # Пошук треку
-        progress.update_progress(10)
-        video_id = search_track(track_name)
-        if not video_id:
-            raise Exception("Трек не знайдено на YouTube Music")
-
-        progress.update_progress(20)
-
-        # Налаштування для yt-dlp з колбеком прогресу
-        def ydl_progress_hook(d):
-            if d['status'] == 'downloading':
-                # Прогрес завантаження від 20% до 60%
-                try:
-                    downloaded = d.get('downloaded_bytes', 0)
-                    total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
-                    if total:
-                        p = int(20 + (downloaded / total * 40))
-                        progress.update_progress(p)
-                except:
-                    pass
-
-        ydl_opts = {
-            "format": AUDIO_QUALITY['format'],
-            "postprocessors": [{
-                "key": "FFmpegExtractAudio",
-                "preferredcodec": AUDIO_QUALITY['audio_format'],
-                "preferredquality": AUDIO_QUALITY['audio_quality'],
-            }],
-            'ffmpeg_location': 'D:\\NBurc\\AI_App\\FFMpeg',
-            "outtmpl": temp_path,
-            "progress_hooks": [ydl_progress_hook],
-            'verbose': True,
-        }
+    def fail(self, error):
+        """Показує помилку замість прогресу"""
+        self.finish(f"❌ Помилка при завантаженні '{self.track_name}': {str(error)}")
 
-        # Завантаження
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([f"https://www.youtube.com/watch?v={video_id}"])
+    def finish(self, text):
+        # Кінцевий стан завжди доходить, а запізнілі оновлення прогресу його не перезапишуть
+        if self.status_message:
+            get_progress_dispatcher(self.bot).update(self.chat_id, self.status_message.message_id, text, final=True)
 
-        progress.update_progress(58)
 
-        process_audio_quality(f"{temp_path}.wav", final_path)
+def resolve_audio_format(audio_format):
+    """Повертає підтримуваний формат (mp3, якщо формат не вказано або він невідомий)"""
+    if audio_format not in OUTPUT_FORMATS:
+        return "mp3"
+    return audio_format
 
-        progress.update_progress(60)
 
-        # Додавання метаданих
-        search_query = f"{track['artist']} {track['name']}"  # Формуємо правильний пошуковий запит
-        result = sp.search(search_query, limit=1)
-        if result['tracks']['items']:
-            track_id = result['tracks']['items'][0]['id']
-            artist_name = result['tracks']['items'][0]['artists'][0]['name']
-            cover_image_data = download_cover_image(track_id)
-            lyrics = get_synced_lyrics(track['name'], track['artist'])
+def download_and_send_track(track, chat_id, audio_format=None):
+    """Завантажує та надсилає трек з індикацією прогресу"""
+    # Локальні змінні замість глобальних: функцію викликають з кількох потоків одночасно
+    track_name = f"{track['artist']} - {track['name']}"
+    progress = DownloadProgress(bot, chat_id, track_name)
+    audio_format = resolve_audio_format(audio_format)
+    file_key = make_track_key(track, audio_format, AUDIO_PROFILE)
+
+    # Трек уже надсилали — повторно відправляємо за file_id без завантаження
+    if telegram_file_ids.send_cached_audio(bot, chat_id, file_key, title=track['name'], performer=track['artist']):
+        return
 
-            if cover_image_data or lyrics:
-                add_metadata_to_mp3(mp3_path, cover_image_data, lyrics, artist_name)
+    try:
+        progress.send_initial_message()
 
-                progress.update_progress(90)
+        final_path = download_track_file(OUTPUT_DIR, track, progress, audio_format)
 
-            # Надсилання файлу
-            with open(f"{file_path}.mp3", 'rb') as audio:
-                bot.send_audio(
+        # Надсилання файлу
+        thumbnail = open_thumbnail(track)
+        try:
+            with open(final_path, 'rb') as audio:
+                sent_message = bot.send_audio(
                     chat_id=chat_id,
                     audio=audio,
                     title=track['name'],
-                    performer=track['artist']
+                    performer=track['artist'],
+                    thumbnail=thumbnail
                 )
+        finally:
+            if thumbnail:
+                thumbnail.close()
+        telegram_file_ids.remember(file_key, sent_message)
 
-            progress.update_progress(100)
-            progress.complete()
+        progress.update_progress(100)
+        progress.complete()
 
-            # Видалення файлу після надсилання
-            os.remove(f"{file_path}.mp3")
+        # Видалення файлу після надсилання
+        os.remove(final_path)
 
     except Exception as e:
         logger.exception(f"Error downloading track {track_name}: {str(e)}")
-        if progress.status_message:
-            bot.edit_message_text(
-                f"❌ Помилка при завантаженні '{track_name}': {str(e)}",
-                chat_id,
-                progress.status_message.message_id
-            )
+        progress.fail(e)
         raise
 def safe_transliterate(text):
     """
@@ -360,109 +367,204 @@ def safe_transliterate(text):
         return re.sub(r'[^\w\s-]', '', text)
 
 AUDIO_QUALITY = {
-            'format': 'bestaudio',
-            'audio_quality': 0,  # Найвища якість
-            'audio_format': 'wav',  # Спочатку завантажуємо у WAV для кращої якості
-            'target_quality': '320k'  # Цільовий бітрейт MP3
+            'format': 'bestaudio',  # Завантажуємо оригінальний аудіопотік без проміжного WAV
+            'target_quality': MP3_BITRATE,  # Цільовий бітрейт MP3 (задається в sp_tools/transcode.py)
+            # "render" — підсилення застосовується при кодуванні, "tag" — лише теги ReplayGain/iTunNORM
+            'loudness_mode': LOUDNESS_MODE_RENDER
         }
 
+# Профіль обробки для ключа кешу: при зміні бітрейту чи нормалізації старі файли не використовуються
+AUDIO_PROFILE = f"{AUDIO_QUALITY['target_quality']}-{AUDIO_QUALITY['loudness_mode']}"
 
-def process_audio_quality(input_path, output_path):
-    """Обробляє аудіо для покращення якості"""
-    # Конвертуємо в WAV з максимальною якістю
-    audio = AudioSegment.from_file(input_path)
 
-    # Застосовуємо нормалізацію гучності
-    normalized_audio = audio.normalize()
+def process_audio_quality(input_path, output_path, audio_format="mp3", source_id=None):
+    """
+    Перекодовує аудіо в цільовий формат за один прохід ffmpeg.
+    Гучність вимірюється один раз для кожного джерела (source_id) і береться з кешу
+    при повторних запитах та зміні формату.
+    """
+    try:
+        measurement = loudness_store.get_or_measure(source_id, input_path) if source_id else None
+    except Exception as e:
+        logger.warning(f"Loudness measurement failed for {input_path}: {str(e)}")
+        measurement = None
 
-    # Експортуємо з високою якістю MP3
-    normalized_audio.export(
-        output_path,
-        format="mp3",
-        bitrate=AUDIO_QUALITY['target_quality'],
-        parameters=["-q:a", "0", "-codec:a", "libmp3lame"]
-    )
+    if measurement is None:
+        # Без вимірювання — динамічна нормалізація loudnorm у тому ж проході
+        transcode_audio(input_path, output_path, audio_format, normalize=True)
+        return
+
+    if AUDIO_QUALITY['loudness_mode'] == LOUDNESS_MODE_TAG:
+        transcode_audio(input_path, output_path, audio_format, normalize=False)
+        write_loudness_tags(output_path, audio_format, measurement)
+    else:
+        transcode_audio(input_path, output_path, audio_format, gain_db=measurement.render_gain())
+
+def find_spotify_track(track):
+    """Повертає об'єкт треку Spotify за ID або, якщо ID невідомий, за пошуком"""
+    track_id = get_spotify_track_id(track)
+    if track_id:
+        # Трек з плейлиста чи посилання — ID вже відомий, пошук не потрібен
+        return sp.track(track_id)
+
+    search_query = f"{track['artist']} {track['name']}"  # Формуємо правильний пошуковий запит
+    result = sp.search(search_query, limit=1)
+    if not result['tracks']['items']:
+        return None
+    return result['tracks']['items'][0]
+
+
+def get_track_record(track):
+    """Компактний запис треку: записи з плейлиста вже повні, інші треки шукаються в Spotify"""
+    if track.get('album_id'):
+        return track
+    spotify_track = find_spotify_track(track)
+    return make_track_record(spotify_track) if spotify_track else None
 
-def download_track_for_zip(temp_folder, track, mp3_path, progress):
-    """Оновлена функція завантаження треку для ZIP архіву"""
+
+def lookup_track_metadata(track):
+    """Шукає трек у Spotify і завантажує обкладинку. Виконується паралельно із завантаженням аудіо"""
+    record = get_track_record(track)
+    if not record:
+        return None
+
+    cover_image_data, _ = cover_store.get(record['album_id'], record['cover_images'])
+    return {
+        "title": record['name'],
+        "artist": record['artist'],
+        "album": record['album'],
+        "cover_image_data": cover_image_data,
+    }
+
+
+def get_track_thumbnail(track):
+    """Шлях до мініатюри обкладинки для send_audio або None"""
     try:
-        track_name = f"{track['artist']} - {track['name']}"
-        file_path = f"{temp_folder}/{track_name}"
-        mp3_path = f"{temp_folder}/{track_name}.mp3"
-        temp_path = os.path.join(temp_folder, f"{track_name}_temp")
-        final_path = os.path.join(temp_folder, f"{track_name}.mp3")
-
-        # Пошук треку
-        progress.update_progress(10)
-        video_id = search_track(track_name)
-        if not video_id:
-            raise Exception("Трек не знайдено на YouTube Music")
-
-        progress.update_progress(20)
-
-        # Налаштування для yt-dlp з колбеком прогресу
-        def ydl_progress_hook(d):
-            if d['status'] == 'downloading':
-                # Прогрес завантаження від 20% до 60%
-                try:
-                    downloaded = d.get('downloaded_bytes', 0)
-                    total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
-                    if total:
-                        p = int(20 + (downloaded / total * 40))
-                        progress.update_progress(p)
-                except:
-                    pass
-
-        ydl_opts = {
-            "format": AUDIO_QUALITY['format'],
-            "postprocessors": [{
-                "key": "FFmpegExtractAudio",
-                "preferredcodec": AUDIO_QUALITY['audio_format'],
-                "preferredquality": AUDIO_QUALITY['audio_quality'],
-            }],
-            'ffmpeg_location': 'D:\\NBurc\\AI_App\\FFMpeg',
-            "outtmpl": temp_path,
-            "progress_hooks": [ydl_progress_hook],
-            'verbose': True,
-        }
+        record = get_track_record(track)
+    except Exception as e:
+        logger.warning(f"Thumbnail lookup failed for {track.get('name')}: {str(e)}")
+        return None
+    if not record:
+        return None
+    return cover_store.get(record['album_id'], record['cover_images'])[1]
+
+
+def open_thumbnail(track):
+    """Відкриває мініатюру для параметра thumbnail у send_audio (None, якщо її немає)"""
+    thumbnail_path = get_track_thumbnail(track)
+    return open(thumbnail_path, 'rb') if thumbnail_path else None
+
+
+def fetch_track_lyrics(track):
+    return get_synced_lyrics(track['name'], track['artist'], track.get('isrc'))
+
+
+def download_track_file(folder, track, progress, audio_format=None, index=None):
+    """
+    Повний цикл для одного треку: пошук на YouTube Music, завантаження, обробка якості
+    і метадані. Повертає шлях до готового файлу в папці folder.
+    index (позиція в плейлисті) додається до імені файлу, щоб треки з однаковою назвою
+    не перезаписували один одного
+    """
+    track_name = f"{track['artist']} - {track['name']}"
+    audio_format = resolve_audio_format(audio_format)
+    file_stem = track_name if index is None else f"{index + 1:03d}. {track_name}"
+    temp_path = os.path.join(folder, f"{file_stem}_temp")
+    final_path = os.path.join(folder, f"{file_stem}.{audio_format}")
+
+    # Метадані, обкладинка і текст збираються у фоні, поки завантажується аудіо
+    enrichment = start_enrichment(track, lookup_track_metadata, fetch_track_lyrics)
+
+    # Пошук треку (для плейлистів зазвичай уже виконаний наперед через video_matcher.prefetch)
+    progress.update_progress(10)
+    video_id = video_matcher.match(track)
+    if not video_id:
+        enrichment.cancel()
+        raise Exception("Трек не знайдено на YouTube Music")
+
+    # Готовий файл уже є в кеші — пропускаємо завантаження, ffmpeg і метадані
+    if audio_cache.fetch(video_id, audio_format, AUDIO_PROFILE, final_path):
+        enrichment.cancel()
+        progress.update_progress(90)
+        return final_path
+
+    progress.update_progress(20)
+
+    # Налаштування для yt-dlp з колбеком прогресу
+    def ydl_progress_hook(d):
+        if d['status'] == 'downloading':
+            # Прогрес завантаження від 20% до 60%
+            try:
+                downloaded = d.get('downloaded_bytes', 0)
+                total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
+                if total:
+                    p = int(20 + (downloaded / total * 40))
+                    progress.update_progress(p)
+            except:
+                pass
+
+    # Без постпроцесора: yt-dlp зберігає оригінальний потік (opus/m4a), а ffmpeg
+    # один раз перекодовує його в потрібний формат
+    ydl_opts = {
+        "format": AUDIO_QUALITY['format'],
+        "outtmpl": f"{temp_path}.%(ext)s",
+        "progress_hooks": [ydl_progress_hook],
+        'verbose': True,
+    }
+
+    # Завантаження
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=True)
+        source_path = ydl.prepare_filename(info)
 
-        # Завантаження
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([f"https://www.youtube.com/watch?v={video_id}"])
+    progress.update_progress(58)
+
+    try:
+        process_audio_quality(source_path, final_path, audio_format, source_id=video_id)
+    finally:
+        if os.path.exists(source_path):
+            os.remove(source_path)
+
+    progress.update_progress(60)
+
+    # Додавання метаданих: чекаємо на фонові запити не довше за їхні дедлайни
+    metadata, lyrics = enrichment.join()
+    metadata = metadata or {}
+    tag_audio_file(
+        final_path,
+        audio_format,
+        title=metadata.get("title", track['name']),
+        artist=metadata.get("artist", track['artist']),
+        album=metadata.get("album"),
+        cover_image_data=metadata.get("cover_image_data"),
+        lyrics=lyrics
+    )
 
-        progress.update_progress(58)
+    progress.update_progress(90)
 
-        process_audio_quality(f"{temp_path}.wav", final_path)
+    # Файл без обкладинки чи тексту через таймаут не кешуємо, інакше він віддаватиметься завжди
+    if enrichment.complete and (not metadata or metadata.get("cover_image_data")):
+        audio_cache.put(video_id, audio_format, AUDIO_PROFILE, final_path)
+    else:
+        logger.info(f"Enrichment for {track_name} is incomplete, not caching the file")
 
-        progress.update_progress(60)
+    return final_path
 
-        # Решта коду залишається без змін...
-        search_query = f"{track['artist']} {track['name']}"
-        result = sp.search(search_query, limit=1)
-        if result['tracks']['items']:
-            track_id = result['tracks']['items'][0]['id']
-            artist_name = result['tracks']['items'][0]['artists'][0]['name']
-            cover_image_data = download_cover_image(track_id)
-            lyrics = get_synced_lyrics(track['name'], track['artist'])
 
-            if cover_image_data or lyrics:
-                add_metadata_to_mp3(mp3_path, cover_image_data, lyrics, artist_name)
+def download_track_for_zip(temp_folder, track, progress, audio_format=None, index=None):
+    """
+    Оновлена функція завантаження треку для ZIP архіву.
+    Повертає шлях до готового файлу, тому її можна запускати в пулі потоків.
+    """
+    track_name = f"{track['artist']} - {track['name']}"
+    try:
+        final_path = download_track_file(temp_folder, track, progress, audio_format, index)
 
         progress.update_progress(100)
         progress.complete()
 
+        return final_path
+
     except Exception as e:
-        logger.exception(f"Error downloading track {track_name} to {mp3_path}: {str(e)}")
+        logger.exception(f"Error downloading track {track_name} to {temp_folder}: {str(e)}")
         raise
-
-def create_zip_file(files, temp_folder):
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for file_path in files:
-            if os.path.exists(file_path):
-                # Використовуємо тільки ім'я файлу для архіву, без шляху
-                file_name = os.path.basename(file_path)
-                zip_file.write(file_path, arcname=file_name)
-
-    zip_buffer.seek(0)
-    return zip_buffer
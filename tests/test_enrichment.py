@@ -0,0 +1,86 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sp_tools.enrichment import TrackEnrichment
+
+executor = ThreadPoolExecutor(max_workers=2)
+
+
+def make_enrichment(metadata_func, lyrics_func):
+    return TrackEnrichment("Artist - Song", executor.submit(metadata_func), executor.submit(lyrics_func))
+
+
+def test_join_marks_complete_when_all_results_arrive():
+    enrichment = make_enrichment(lambda: {"title": "Song"}, lambda: "lyrics")
+    assert enrichment.join() == ({"title": "Song"}, "lyrics")
+    assert enrichment.complete
+
+
+def test_join_marks_incomplete_on_timeout():
+    release = threading.Event()
+    enrichment = make_enrichment(lambda: {"title": "Song"}, lambda: release.wait(5))
+    metadata, lyrics = enrichment.join(metadata_timeout=1, lyrics_timeout=0.05)
+    release.set()
+    assert metadata == {"title": "Song"}
+    assert lyrics is None
+    assert not enrichment.complete
+
+
+def test_join_marks_incomplete_on_error():
+    def fail():
+        raise RuntimeError("provider is down")
+
+    enrichment = make_enrichment(fail, lambda: None)
+    assert enrichment.join() == (None, None)
+    assert not enrichment.complete
+
+
+class FakeProgress:
+    def update_progress(self, value):
+        pass
+
+
+def test_timed_out_enrichment_is_not_cached(tmp_path, monkeypatch):
+    spotify_logik = pytest.importorskip("spotify_logik")
+
+    class FakeYoutubeDL:
+        def __init__(self, options):
+            self.source_path = options["outtmpl"].replace("%(ext)s", "webm")
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def extract_info(self, url, download):
+            open(self.source_path, "wb").close()
+            return {}
+
+        def prepare_filename(self, info):
+            return self.source_path
+
+    class TimedOutEnrichment:
+        complete = False
+
+        def join(self):
+            return None, None
+
+        def cancel(self):
+            pass
+
+    stored = []
+    monkeypatch.setattr(spotify_logik, "start_enrichment", lambda *args: TimedOutEnrichment())
+    monkeypatch.setattr(spotify_logik.video_matcher, "match", lambda track: "video-id")
+    monkeypatch.setattr(spotify_logik.audio_cache, "fetch", lambda *args: False)
+    monkeypatch.setattr(spotify_logik.audio_cache, "put", lambda *args: stored.append(args))
+    monkeypatch.setattr(spotify_logik.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    monkeypatch.setattr(spotify_logik, "process_audio_quality", lambda source, final, *args, **kwargs: open(final, "wb").close())
+    monkeypatch.setattr(spotify_logik, "tag_audio_file", lambda *args, **kwargs: None)
+
+    track = {"name": "Song", "artist": "Artist"}
+    spotify_logik.download_track_file(str(tmp_path), track, FakeProgress(), "mp3")
+
+    assert stored == []
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import deque
+
+from sp_tools.job_bus import InMemoryJobBus, EVENT_CLAIMED, EVENT_DONE
+from sp_tools.job_queue import Job, PRIORITY_ADMIN, PRIORITY_PLAYLIST
+
+
+def crash_worker(bus, job):
+    """Виконавець "упав": задача більше не продовжується фоновим потоком"""
+    bus._untrack(job)
+
+
+def test_claim_follows_priority_and_complete_acks():
+    bus = InMemoryJobBus()
+    playlist_id = bus.enqueue("playlist", 1, {"chat_id": 1}, PRIORITY_PLAYLIST)
+    admin_id = bus.enqueue("track", 2, {"chat_id": 2}, PRIORITY_ADMIN)
+    assert bus.pending_count() == 2
+    assert bus.position(admin_id) == 0
+    assert bus.position(playlist_id) == 1
+
+    job = bus.claim(timeout=1)
+    assert (job.id, job.kind, job.user_id, job.attempts) == (admin_id, "track", 2, 1)
+    bus.complete(job)
+    assert job.id not in bus.leases
+
+    job = bus.claim(timeout=1)
+    assert job.id == playlist_id
+    bus.complete(job)
+    assert bus.claim(timeout=0.05) is None
+
+
+def test_expired_job_is_reclaimed():
+    bus = InMemoryJobBus(visibility_timeout=0.1)
+    job_id = bus.enqueue("track", 1, {"chat_id": 1})
+    crash_worker(bus, bus.claim(timeout=1))
+
+    job = bus.claim(timeout=1)
+    assert job.id == job_id
+    assert job.attempts == 2
+
+
+def test_job_is_dead_lettered_after_max_deliveries():
+    bus = InMemoryJobBus(visibility_timeout=0.1, max_deliveries=2)
+    job_id = bus.enqueue("track", 1, {"chat_id": 1})
+    for _ in range(2):
+        crash_worker(bus, bus.claim(timeout=1))
+
+    assert bus.claim(timeout=0.3) is None
+    assert [(job.id, reason) for job, reason in bus.dead] == [(job_id, "too many deliveries")]
+
+
+def test_failed_job_is_dead_lettered():
+    bus = InMemoryJobBus()
+    bus.enqueue("track", 1, {"chat_id": 1})
+    job = bus.claim(timeout=1)
+    bus.fail(job, "boom")
+    assert [reason for _, reason in bus.dead] == ["boom"]
+
+
+def read_events(bus, events, count):
+    def reader():
+        for event in bus.iter_events(block=50):
+            events.append(event)
+            if len(events) == count:
+                return
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    time.sleep(0.1)  # Читач починає з подій, опублікованих після старту
+    return thread
+
+
+def test_event_stream_reports_job_lifecycle():
+    bus = InMemoryJobBus()
+    events = []
+    thread = read_events(bus, events, 2)
+    bus.enqueue("track", 1, {"chat_id": 42})
+    bus.complete(bus.claim(timeout=1))
+    thread.join(2)
+
+    assert [(event["status"], event["chat_id"]) for event in events] == [(EVENT_CLAIMED, "42"), (EVENT_DONE, "42")]
+
+
+def test_event_stream_keeps_going_after_events_are_trimmed():
+    bus = InMemoryJobBus()
+    bus.events = deque(maxlen=5)
+    events = []
+    thread = read_events(bus, events, 14)
+    job = Job("1/1", "track", 1, PRIORITY_ADMIN, {"chat_id": 1})
+    for number in range(14):
+        bus.publish_event(job, EVENT_DONE, str(number))
+        time.sleep(0.01)
+    thread.join(2)
+
+    assert [event["detail"] for event in events] == [str(number) for number in range(14)]
@@ -0,0 +1,30 @@
+from sp_tools.job_queue import JobQueue, MAX_JOB_ATTEMPTS, PRIORITY_ADMIN, PRIORITY_PLAYLIST
+
+
+def test_claim_follows_priority_and_rotates_users(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_running_per_user=2)
+    queue.enqueue("track", 1, {"n": 1})
+    queue.enqueue("track", 1, {"n": 2})
+    queue.enqueue("track", 2, {"n": 3})
+    queue.enqueue("playlist", 3, {"n": 4}, PRIORITY_PLAYLIST)
+    queue.enqueue("track", 4, {"n": 5}, PRIORITY_ADMIN)
+
+    claimed = [queue.claim(timeout=0).payload["n"] for _ in range(5)]
+
+    # Адмін першим, далі користувачі смуги по черзі, плейлист останнім
+    assert claimed == [5, 1, 3, 2, 4]
+    assert queue.claim(timeout=0) is None
+
+
+def test_interrupted_job_is_requeued_until_attempts_run_out(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    job_id = JobQueue(db_path).enqueue("track", 1, {"n": 1})
+
+    for attempt in range(1, MAX_JOB_ATTEMPTS + 1):
+        # Задачу взяли в роботу, і бот зупинився, не завершивши її
+        job = JobQueue(db_path).claim(timeout=0)
+        assert (job.id, job.attempts) == (job_id, attempt)
+
+    queue = JobQueue(db_path)
+    assert queue.pending_count() == 0
+    assert queue.connection.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()[0] == "failed"
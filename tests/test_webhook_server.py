@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("telebot")
+pytest.importorskip("fastapi")
+from fastapi.testclient import TestClient
+
+from sp_tools.webhook_server import WEBHOOK_PATH, create_webhook_app
+
+SECRET = "test-secret"
+
+# Оновлення, як його надсилає Telegram
+UPDATE = {
+    "update_id": 100,
+    "message": {
+        "message_id": 1,
+        "date": 1700000000,
+        "chat": {"id": 42, "type": "private", "first_name": "Test"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "text": "/start",
+    },
+}
+
+
+class RecordingBot:
+    def __init__(self):
+        self.updates = []
+
+    def process_new_updates(self, updates):
+        self.updates.extend(updates)
+
+
+def test_update_with_valid_secret_is_processed():
+    bot = RecordingBot()
+    client = TestClient(create_webhook_app(bot, SECRET))
+
+    response = client.post(WEBHOOK_PATH, json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+
+    assert response.status_code == 200
+    assert [update.update_id for update in bot.updates] == [100]
+
+
+def test_update_with_wrong_secret_is_rejected():
+    bot = RecordingBot()
+    client = TestClient(create_webhook_app(bot, SECRET))
+
+    response = client.post(WEBHOOK_PATH, json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+
+    assert response.status_code == 403
+    assert bot.updates == []
+    assert client.get("/health").json()["rejected"] == 1